@@ -0,0 +1,121 @@
+from lxml import etree, html
+from cssselect import GenericTranslator
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import glob
+import json
+import os
+import re
+from selenium_extract import extract_no_centris
+
+# Offline parser of listing pages saved by selenium_extract.py --capture
+# Produces the same key/value dicts as scrape_house, without a browser:
+#   python parse_pages.py pages/url_1 -o all_houses_1.json --workers 8
+
+translator = GenericTranslator()
+xpaths = {}
+
+# Descendants matching a CSS selector, in document order (like WebElement.find_elements)
+def find_all(element, css):
+    if css not in xpaths:
+        xpaths[css] = etree.XPath(translator.css_to_xpath(css, prefix='descendant::'))
+    return xpaths[css](element)
+
+def find_first(element, css):
+    found = find_all(element, css)
+    if not found:
+        raise ValueError(f"No element matches {css}")
+    return found[0]
+
+# Approximation of WebElement.text: <br> as newlines, collapsed whitespace (non-breaking spaces kept)
+def element_text(element):
+    parts = []
+
+    def walk(node):
+        if not isinstance(node.tag, str) or node.tag in ('script', 'style'):
+            return
+        if node.tag == 'br':
+            parts.append('\n')
+        elif node.text:
+            parts.append(re.sub(r'[ \t\n\r\f\v]+', ' ', node.text))
+        for child in node:
+            walk(child)
+            if child.tail:
+                parts.append(re.sub(r'[ \t\n\r\f\v]+', ' ', child.tail))
+
+    walk(element)
+    return '\n'.join(line.strip(' ') for line in ''.join(parts).split('\n')).strip(' \n')
+
+def parse_row(row, scraped_data, special=False):
+    if special:
+        param_names = find_all(row, '.d-textStrong, .d-section:not(.d-fontWeight--semibold)')
+        param_values = find_all(row, '.d-fontSize--smallest:not(.d-textStrong), .d-fontSize--smaller, .formula')
+    else:
+        param_names = find_all(row, '.d-textStrong, .d-section')
+        param_values = find_all(row, '.d-fontSize--smallest:not(.d-textStrong), .d-fontSize--smaller:not(.d-textStrong), .formula')
+
+    for name, value in zip(param_names, param_values):
+        clean_value = element_text(value).replace('\xa0', ' ').strip()
+        scraped_data[element_text(name).replace('\n', ' ').strip()] = clean_value
+
+# Same fields and order as selenium_extract.scrape_house
+def parse_house(page_source):
+    page = html.fromstring(page_source)
+    scraped_data = {}
+
+    # Addresse, YearBuilt
+    for css, key in [('.d-mega', 'Addresse'), ('.d-textSoft .formula', 'YearBuilt')]:
+        elem = element_text(find_first(page, css))
+        scraped_data[key] = ' '.join(elem.split('\n')).strip()
+
+    # Containers 1
+    container = find_first(page, '.col-sm-6.d-borderWidthLeft--1')
+    for row in find_all(container, '.row'):
+        parse_row(row, scraped_data)
+
+    # Container 2 (direct children 5 to 9)
+    container2 = find_first(page, '.col-sm-6.d-bgcolor--systemLightest')
+    direct_children = container2.xpath('./div[contains(@class, "row")]')
+    for i in range(len(direct_children)):
+        if i+1 in [5, 6, 7, 8, 9]:
+            parse_row(direct_children[i], scraped_data)
+
+    # Container 3 (2nd child of container 2)
+    for row in find_all(direct_children[1], '.row:not(.hidden-xs.hidden-sm)'):
+        parse_row(row, scraped_data, special=True)
+
+    # Special Case, the number after "No Centris : "
+    no_centris_number = extract_no_centris(element_text(find_first(page, '.d-subtextSoft.d-fontSize--smallest')))
+    if no_centris_number is not None:
+        scraped_data["No Centris"] = no_centris_number
+
+    return scraped_data
+
+def parse_page_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_house(f.read())
+
+def house_number(path):
+    # house_12.html -> 12, so pages are parsed in scraping order
+    match = re.search(r'(\d+)\.html$', path)
+    return int(match.group(1)) if match else -1
+
+# Bulk parsing across processes
+def parse_pages(paths, workers=None, chunksize=16):
+    paths = sorted(paths, key=house_number)
+    if workers == 1:
+        return [parse_page_file(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(parse_page_file, paths, chunksize=chunksize))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pages_dir', help='directory of captured house_N.html pages')
+    parser.add_argument('-o', '--output', required=True, help='all_houses_N.json to write')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    all_houses = parse_pages(glob.glob(os.path.join(args.pages_dir, 'house_*.html')), args.workers)
+    with open(args.output, 'w') as f:
+        json.dump(all_houses, f)
+    print(f"{len(all_houses)} houses parsed to {args.output}")
@@ -2,28 +2,45 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from IPython.display import display, clear_output # for Jupyter Notebook only
-import subprocess # for VSCode
+from selenium.common.exceptions import StaleElementReferenceException
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import threading
+import glob
 import json
 import time
-
-# Environment variable
 import os
-sensitive_url = os.getenv('SENSITIVE_URL').split(',')
-
-# Clear terminal screen
-def clear_terminal():
-    os.system('clear')  # For macOS and Linux
-    # os.system('cls')  # For Windows
-
-# Bring Safari to focus
-def focus_on_safari():
-    script = '''
-    tell application "Safari"
-        activate
-    end tell
-    '''
-    subprocess.run(["osascript", "-e", script])
+
+# Scrape the search URLs of SENSITIVE_URL (comma separated) in parallel with headless drivers:
+#   SENSITIVE_URL=... python selenium_extract.py --workers 4 --browser firefox
+# Against the local static replica of the listing pages:
+#   python selenium_extract.py --urls file://$PWD/replica/search.html --workers 1
+# Capture mode (pages parsed offline with parse_pages.py):
+#   python selenium_extract.py --capture pages && python parse_pages.py pages/url_1 -o all_houses_1.json
+
+# Headless driver for one worker
+def make_driver(browser='firefox'):
+    if browser == 'firefox':
+        options = webdriver.FirefoxOptions()
+        options.add_argument('-headless')
+        return webdriver.Firefox(options=options)
+    if browser in ('chrome', 'chromium'):
+        options = webdriver.ChromeOptions()
+        options.add_argument('--headless=new')
+        return webdriver.Chrome(options=options)
+    raise ValueError(f"Unknown browser: {browser}, expected 'firefox' or 'chromium'")
+
+# Use string methods to find the number after "No Centris : "
+def extract_no_centris(special_text):
+    start_index = special_text.find("No Centris : ")
+    if start_index == -1:
+        return None
+    start_index += len("No Centris : ")
+    end_index = special_text.find("Date d'envoi : ")
+    if end_index == -1:
+        end_index = None  # Take until the end of the string if "Date d'envoi : " is not found
+
+    return special_text[start_index:end_index].strip()
 
 # Scrape each house
 def scrape_house(driver):
@@ -69,23 +86,14 @@ def scrape_house(driver):
     
         # Special Case
         special_row = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '.d-subtextSoft.d-fontSize--smallest')))
-        special_text = special_row.text
-
-        # Use string methods to find the number after "No Centris : "
-        start_index = special_text.find("No Centris : ")
-        if start_index != -1:
-            start_index += len("No Centris : ")
-            end_index = special_text.find("Date d'envoi : ")
-            if end_index == -1:
-                end_index = None  # Take until the end of the string if "Date d'envoi : " is not found
-            no_centris_number = special_text[start_index:end_index].strip()
+        no_centris_number = extract_no_centris(special_row.text)
+        if no_centris_number is not None:
             scraped_data["No Centris"] = no_centris_number
         print("special case good")
         
     except Exception as e:
         print(f"An error occurred: {e}")
-        driver.quit()  # Close the driver
-        exit(1)  # Stop the program
+        raise  # Let the worker retry policy handle it
     
     return scraped_data
 
@@ -116,45 +124,224 @@ def special_scrape_row(row, scraped_data):
         print(f"An error occurred in special_scrape_row: {e}")
         raise  # Re-raise the caught exception
 
-# Find the last existing JSON file
-last_file_index = -1
-max_houses_per_file = 500
+# Append-only JSONL checkpoint, one scraped house per line
+class JsonlWriter:
+    def __init__(self, path, fsync_every=10):
+        self.path = path
+        self.fsync_every = fsync_every  # fsync once every N houses, flush after each one
+        self.pending = 0
+        self.f = open(path, 'a', encoding='utf-8')
 
-for i in range(len(sensitive_url)):
-    try:
-        with open(f"all_houses_{i+1}.json", 'r') as f:
-            all_houses = json.load(f)
-        last_file_index = i
-    except FileNotFoundError:
-        break
-
-# Main loop starts from the last found file index
-for i in range(last_file_index, len(sensitive_url)):
-    if last_file_index != -1 and i == last_file_index:
-        # If we found a last file, and we are on it, use its data
-        with open(f"all_houses_{i+1}.json", 'r') as f:
-            all_houses = json.load(f)
-    else:
-        # Otherwise, start fresh for this URL
-        all_houses = []
-    
-    print(f"Starting with json file no.: {i + 1}")
+    def write(self, record):
+        self.f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.f.flush()
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self.f.fileno())
+        self.pending = 0
+
+    def close(self):
+        self.sync()
+        self.f.close()
+
+# Read the last valid record from the end of the file, dropping a partial line left by a crash
+def last_jsonl_record(path, block_size=65536):
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        tail = b''
+        while end > 0:
+            start = max(0, end - block_size)
+            f.seek(start)
+            tail = f.read(end - start) + tail
+            end = start
+            lines = tail.split(b'\n')
+            # The first line may be cut by the block boundary unless we reached the start of the file
+            candidates = lines if start == 0 else lines[1:]
+            for position in range(len(candidates) - 1, -1, -1):
+                try:
+                    record = json.loads(candidates[position])
+                except ValueError:
+                    continue
+                if not isinstance(record, dict):
+                    continue
+                # Truncate whatever follows the last valid record
+                valid_end = start + len(tail) - len(b'\n'.join(candidates[position + 1:]))
+                f.truncate(valid_end)
+                return record
+            if start == 0:
+                break
+
+        f.truncate(0)
+    return None
+
+# Converter to the original all_houses_N.json format (a single JSON array)
+def jsonl_to_json(jsonl_path, json_path):
+    all_houses = []
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            # Bookkeeping records (skipped duplicates, completion markers) only have '_' keys
+            if all(key.startswith('_') for key in record):
+                continue
+            record.pop('_index', None)
+            record.pop('_total', None)
+            all_houses.append(record)
+
+    with open(json_path, 'w') as f:
+        json.dump(all_houses, f)
+
+    return len(all_houses)
+
+# One-time migration of an existing all_houses_N.json checkpoint to JSONL
+def json_to_jsonl(json_path, jsonl_path):
+    with open(json_path, 'r') as f:
+        all_houses = json.load(f)
+    with open(jsonl_path, 'w', encoding='utf-8') as f:
+        for index, house in enumerate(all_houses):
+            f.write(json.dumps({**house, '_index': index}, ensure_ascii=False) + '\n')
+
+def migrate_checkpoint(i):
+    checkpoint = f"all_houses_{i+1}.jsonl"
+    if not os.path.exists(checkpoint) and os.path.exists(f"all_houses_{i+1}.json"):
+        json_to_jsonl(f"all_houses_{i+1}.json", checkpoint)
+
+# Readiness wait after a "next" click: the previous house is replaced (stale or different No Centris)
+def wait_for_next_house(driver, previous_house, previous_text, timeout=10):
+    def next_house_loaded(driver):
+        try:
+            return previous_house.text != previous_text
+        except StaleElementReferenceException:
+            house = driver.find_elements(By.CSS_SELECTOR, '.d-subtextSoft.d-fontSize--smallest')
+            return bool(house) and house[0].text != previous_text
+
+    WebDriverWait(driver, timeout).until(next_house_loaded)
+
+def click_next(driver):
+    previous_house = WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, '.d-subtextSoft.d-fontSize--smallest'))
+    )
+    next_button = WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.CSS_SELECTOR, 'a.glyphicon.glyphicon-chevron-right'))
+    )
+    # Read before the click: a navigation that completes with the click already makes the element stale
+    previous_text = previous_house.text
+    next_button.click()
+    wait_for_next_house(driver, previous_house, previous_text)
+
+# Persisted set of the No Centris already scraped (shared by the workers, across all URLs)
+class SeenCentris:
+    def __init__(self, path='seen_centris.txt'):
+        self.path = path
+        self.lock = threading.Lock()
+        if not os.path.exists(path):
+            # First run with this file: seed it from the existing checkpoints
+            with open(path, 'w') as f:
+                for checkpoint in glob.glob('all_houses_*.jsonl'):
+                    with open(checkpoint, 'r', encoding='utf-8') as houses:
+                        for line in houses:
+                            try:
+                                no_centris = json.loads(line).get('No Centris')
+                            except (ValueError, AttributeError):
+                                continue
+                            if no_centris:
+                                f.write(no_centris + '\n')
+        with open(path, 'r') as f:
+            self.seen = set(f.read().split())
+        self.f = open(path, 'a')
+
+    def add_if_new(self, no_centris):
+        # Test and add in one step under the lock: only one worker gets True for a given listing
+        with self.lock:
+            if not no_centris:
+                return True
+            if no_centris in self.seen:
+                return False
+            self.seen.add(no_centris)
+            self.f.write(no_centris + '\n')
+            self.f.flush()
+            return True
+
+    def discard(self, no_centris):
+        # A claimed listing that could not be scraped, so the retry scrapes it again
+        with self.lock:
+            if no_centris not in self.seen:
+                return
+            self.seen.discard(no_centris)
+            self.f.close()
+            with open(self.path, 'w') as f:
+                f.writelines(seen + '\n' for seen in self.seen)
+            self.f = open(self.path, 'a')
+
+    def close(self):
+        self.f.close()
+
+# No Centris of the displayed house, without scraping the whole page
+def current_no_centris(driver):
+    special_row = WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, '.d-subtextSoft.d-fontSize--smallest'))
+    )
+    return extract_no_centris(special_row.text)
+
+# Position (0-based) of the displayed house in the search results
+def current_position(driver):
+    position_element = WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.XPATH, '//*[@id="_ctl0_m_lblPagingSummary"]/ul/b[1]'))
+    )
+    return int(position_element.text) - 1
+
+# Open the house at a given index directly: the Redisplay link carries the index of the house to display
+def open_house(driver, link, index):
+    driver.execute_script(
+        "arguments[0].href = arguments[0].href.replace('Redisplay|20547,,0', 'Redisplay|20547,,' + arguments[1]);"
+        "arguments[0].click();", link, index
+    )
+
+# Scrape every house of one search URL, resuming from its checkpoint
+# In capture mode the page source of each house is saved once and parsed offline by parse_pages.py
+def scrape_url(i, url, browser='firefox', capture_dir=None, seen=None):
+    checkpoint = f"captured_{i+1}.jsonl" if capture_dir else f"all_houses_{i+1}.jsonl"
+    if not capture_dir:
+        migrate_checkpoint(i)
+    if capture_dir:
+        os.makedirs(os.path.join(capture_dir, f"url_{i+1}"), exist_ok=True)
+
+    # Resume after the last valid house of the checkpoint (0 for a fresh URL)
+    last_house = last_jsonl_record(checkpoint)
+    houses_done = last_house['_index'] + 1 if last_house else 0
+    # Records carry the number of houses of the search, a migrated .json checkpoint does not
+    known_total = last_house.get('_total') if last_house else None
+
+    if known_total is not None and houses_done >= known_total:
+        # URL already completed, no driver needed
+        print(f"[url {i+1}] Already complete with {known_total} houses")
+        if not capture_dir:
+            jsonl_to_json(checkpoint, f"all_houses_{i+1}.json")
+        return known_total
+
+    writer = JsonlWriter(checkpoint)
+    driver = make_driver(browser)
+
+    print(f"[url {i+1}] Starting with json file no.: {i + 1}")
 
     try:
-        # Main
-        driver = webdriver.Safari()
-        driver.get(sensitive_url[i])
-        focus_on_safari()  # Bring Safari to focus
+        driver.get(url)
 
         # Wait for the page to load
         wait = WebDriverWait(driver, 30)
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, f"a[href*='Redisplay|20547,,0']")))
+        clickable_element = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, f"a[href*='Redisplay|20547,,0']")))
 
-        # Click to get the first house
-        clickable_element = driver.find_element(By.CSS_SELECTOR, f"a[href*='Redisplay|20547,,0']")
-        
-        #clickable_element.click()
-        driver.execute_script("arguments[0].click();", clickable_element)
+        # Open the first house, or jump straight to the house where you left off. Without a known total, the last
+        # done house is opened instead (the next one may not exist) and the fallback below clicks on from there
+        open_house(driver, clickable_element, houses_done if known_total is not None or houses_done == 0 else houses_done - 1)
 
         # Wait for the house details to load
         wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, '.d-mega')))
@@ -163,50 +350,98 @@ for i in range(last_file_index, len(sensitive_url)):
         total_houses_element = wait.until(EC.presence_of_element_located((By.XPATH, '//*[@id="_ctl0_m_lblPagingSummary"]/ul/b[2]')))
         total_houses = int(total_houses_element.text)
     
-        # Skip to the house where you left off, if any
-        if len(all_houses) > 0:
-            for _ in range(len(all_houses)):
-                next_button = WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, 'a.glyphicon.glyphicon-chevron-right'))
-                )
-                next_button.click()
-                time.sleep(2)
+        # Fall back to "next" clicks if the jump was not honoured
+        position = current_position(driver)
+        for _ in range(min(houses_done, total_houses - 1) - position):
+            click_next(driver)
+        if houses_done < total_houses and current_position(driver) != houses_done:
+            raise RuntimeError(f"Could not resume at house {houses_done}, displayed house is {current_position(driver)}")
+        if houses_done >= total_houses:
+            # Completed migrated checkpoint: record the total, later runs skip the URL without a driver
+            writer.write({'_index': total_houses - 1, '_total': total_houses})
 
         # Loop through each house
-        for j in range(len(all_houses), total_houses):
-            print(f"Url no.: {i+1}")
-            print(f"House no.{j} out of {total_houses}")
-        
-            try:
-                scraped_data = scrape_house(driver)
-                all_houses.append(scraped_data)
-
-                # Dump the data to a JSON file
-                with open(f"all_houses_{i+1}.json", 'w') as f:
-                    json.dump(all_houses, f)
-
-                # Clear terminal
-                clear_output(wait=True) # For Notebook
-                clear_terminal() # VSCode
-
-                # Click the "Next" button to go to the next house
-                if j < total_houses - 1:
-                    next_button = WebDriverWait(driver, 10).until(
-                        EC.presence_of_element_located((By.CSS_SELECTOR, 'a.glyphicon.glyphicon-chevron-right'))
-                    )
-                    next_button.click()
-                    time.sleep(2)
-
-            except Exception as e:
-                print(f"An error occurred: {e}")
-                driver.quit()
-                exit(1)
-            
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        for j in range(houses_done, total_houses):
+            print(f"[url {i+1}] House no.{j} out of {total_houses}")
+
+            no_centris = current_no_centris(driver)
+            if seen is not None and not seen.add_if_new(no_centris):
+                # Already scraped (in this or another search), keep only the position in the checkpoint
+                print(f"[url {i+1}] Skipping duplicate No Centris {no_centris}")
+                writer.write({'_index': j, '_total': total_houses, '_duplicate': no_centris})
+            else:
+                try:
+                    if capture_dir:
+                        # Save the page once the house is displayed
+                        page_path = os.path.join(capture_dir, f"url_{i+1}", f"house_{j}.html")
+                        with open(page_path, 'w', encoding='utf-8') as f:
+                            f.write(driver.page_source)
+                        writer.write({'_index': j, '_total': total_houses, 'page': page_path, 'No Centris': no_centris})
+                    else:
+                        scraped_data = scrape_house(driver)
+
+                        # Append the house to the JSONL checkpoint
+                        writer.write({**scraped_data, '_index': j, '_total': total_houses})
+                except Exception:
+                    if seen is not None:
+                        seen.discard(no_centris)
+                    raise
+
+            # Click the "Next" button to go to the next house
+            if j < total_houses - 1:
+                click_next(driver)
+
+    finally:
+        writer.close()
         driver.quit()
-        exit(1)
-        
-    print("quitting driver")
-    driver.quit()
-    time.sleep(2)  
\ No newline at end of file
+
+    # URL completed, keep producing the original JSON array file
+    if not capture_dir:
+        jsonl_to_json(checkpoint, f"all_houses_{i+1}.json")
+
+    return total_houses
+
+# Retry policy of a worker: restart the driver and resume from the checkpoint, with exponential backoff
+def scrape_url_with_retry(i, url, browser='firefox', retries=3, backoff=5, capture_dir=None, seen=None):
+    for attempt in range(retries + 1):
+        try:
+            return scrape_url(i, url, browser, capture_dir, seen)
+        except Exception as e:
+            if attempt == retries:
+                print(f"[url {i+1}] Giving up after {retries + 1} attempts: {e}")
+                return None
+            delay = backoff * 2 ** attempt
+            print(f"[url {i+1}] An error occurred: {e}, retrying in {delay}s")
+            time.sleep(delay)
+
+# Pool of headless drivers, one search URL per task
+def scrape_all(urls, workers=4, browser='firefox', retries=3, backoff=5, capture_dir=None, seen_path='seen_centris.txt'):
+    # Legacy .json checkpoints are migrated first, so their listings seed the seen set
+    if seen_path and not capture_dir:
+        for i in range(len(urls)):
+            migrate_checkpoint(i)
+    seen = SeenCentris(seen_path) if seen_path else None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda args: scrape_url_with_retry(*args, browser, retries, backoff, capture_dir, seen), enumerate(urls)))
+    if seen is not None:
+        seen.close()
+
+    for i, total_houses in enumerate(results):
+        print(f"Url no.: {i+1}: {'failed' if total_houses is None else f'{total_houses} houses'}")
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--urls', default=os.getenv('SENSITIVE_URL', ''), help='comma separated search URLs (default: SENSITIVE_URL)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--browser', default='firefox', choices=['firefox', 'chromium', 'chrome'])
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--backoff', type=float, default=5, help='seconds before the first retry, doubled each time')
+    parser.add_argument('--capture', metavar='DIR', default=None, help='save each page source to DIR/url_N/ instead of scraping fields')
+    parser.add_argument('--seen', default='seen_centris.txt', help="file of already scraped No Centris ('' to disable)")
+    args = parser.parse_args()
+
+    urls = [url for url in args.urls.split(',') if url]
+    results = scrape_all(urls, args.workers, args.browser, args.retries, args.backoff, args.capture, args.seen)
+    exit(0 if all(total_houses is not None for total_houses in results) else 1)
@@ -0,0 +1,41 @@
+# Benchmark of clean_data on data/train.csv replicated to a large number of rows, against the row-wise reference
+# Run from src/: python -m benchmarks.clean_data_benchmark --rows 1000000 --reference-rows 10000
+import argparse
+import time
+import pandas as pd
+from modules.data_loading import load_train_data
+from modules.data_preprocessing import clean_data
+from benchmarks.reference_clean_data import clean_data_rowwise
+
+def replicate(df, rows):
+    # Repeat the training rows until the frame reaches the requested size
+    repeats = -(-rows // len(df))
+    return pd.concat([df] * repeats, ignore_index=True).iloc[:rows]
+
+def timed(function, df):
+    start = time.perf_counter()
+    result = function(df)
+    return result, time.perf_counter() - start
+
+def run(rows, reference_rows=10000):
+    df = replicate(load_train_data(), rows)
+
+    df_cleaned, elapsed = timed(clean_data, df)
+    print(f"clean_data:          {rows} rows in {elapsed:.2f} s ({rows / elapsed:,.0f} rows/s), {len(df_cleaned)} rows kept")
+
+    # The row-wise reference runs on a sample only (about 1k rows/s), its output must match on that sample
+    sample = df.iloc[:min(rows, reference_rows)]
+    df_reference, reference_elapsed = timed(clean_data_rowwise, sample)
+    pd.testing.assert_frame_equal(df_reference, clean_data(sample))
+    print(f"row-wise reference:  {len(sample)} rows in {reference_elapsed:.2f} s ({len(sample) / reference_elapsed:,.0f} rows/s), same output")
+
+    speedup = (rows / elapsed) / (len(sample) / reference_elapsed)
+    print(f"speedup: {speedup:.1f}x rows/s (reference on {rows} rows: ~{rows * reference_elapsed / len(sample):.1f} s)")
+    return elapsed, reference_elapsed * rows / len(sample)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--reference-rows', type=int, default=10000, help='rows cleaned by the row-wise reference')
+    args = parser.parse_args()
+    run(args.rows, args.reference_rows)
@@ -0,0 +1,183 @@
+# Throughput of the pipeline stages on synthetic Centris listings, saved as a JSON baseline
+# Run from src/:
+#   python -m benchmarks.pipeline_benchmark --rows 1000 100000 1000000 --output benchmarks/baseline.json
+#   python -m benchmarks.pipeline_benchmark --rows 1000 100000 --baseline benchmarks/baseline.json
+import argparse
+import contextlib
+import ctypes
+import gc
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import sklearn
+from benchmarks.synthetic_listings import generate_listings
+from modules.data_preprocessing import clean_data, feature_engineering
+from modules.modeling import main, predict_price, predominant_features, ModelRegistry
+from modules.instrumentation import rss_mb
+
+# tracemalloc only sees the allocations going through the Python allocator (numpy arrays included), not the
+# buffers of pyarrow (the str columns) or other native libraries: the RSS peak of the call covers them
+memory_notes = ("peak_memory_mb: tracemalloc peak, misses pyarrow and native allocations (str columns). "
+                "peak_rss_delta_mb: resident memory sampled every 5 ms during the call, minus the resident memory before it; "
+                "freed heap is released before the call, short spikes between samples are not counted.")
+
+def release_memory():
+    # Gives the freed heap of the earlier calls back to the system, so the next RSS delta is not absorbed by it
+    gc.collect()
+    pa.default_memory_pool().release_unused()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def peak_rss_delta(function, *args, interval=0.005):
+    # Peak resident memory above its level before the call, sampled from a background thread
+    release_memory()
+    before = rss_mb()
+    if before is None:
+        function(*args)
+        return None
+    peak = [before]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(interval):
+            peak[0] = max(peak[0], rss_mb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        function(*args)
+    finally:
+        done.set()
+        sampler.join()
+
+    return max(peak[0], rss_mb()) - before
+
+def measure(function, *args, memory=True, repeat=1):
+    # Best wall time of repeat calls, then peak traced memory and peak RSS delta of one more call each
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds = np.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function(*args)
+            seconds = min(seconds, time.perf_counter() - start)
+
+        peak, rss_delta = None, None
+        if memory:
+            tracemalloc.start()
+            function(*args)
+            peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+            rss_delta = peak_rss_delta(function, *args)
+
+    return result, seconds, peak, rss_delta
+
+def run(rows, memory=True, seed=0):
+    raw = generate_listings(rows, seed)
+    results = []
+    # Small sizes are dominated by noise and first call overheads, keep the best of several runs
+    repeat = max(1, min(5, 100000 // rows))
+
+    def record(stage, seconds, peak, rss_delta, n):
+        results.append({'stage': stage, 'rows': rows, 'processed_rows': n, 'seconds': seconds, 'rows_per_sec': n / seconds,
+                        'peak_memory_mb': peak, 'peak_rss_delta_mb': rss_delta,
+                        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+        print(f"{stage:>20} {rows:>9} rows: {seconds:8.2f} s {n / seconds:>12,.0f} rows/s" +
+              (f" {peak:9.1f} MB traced" if peak is not None else '') +
+              (f" {rss_delta:9.1f} MB RSS" if rss_delta is not None else ''))
+
+    df_cleaned, seconds, peak, rss_delta = measure(clean_data, raw, memory=memory, repeat=repeat)
+    record('clean_data', seconds, peak, rss_delta, len(raw))
+
+    df_engineered, seconds, peak, rss_delta = measure(feature_engineering, df_cleaned, memory=memory, repeat=repeat)
+    record('feature_engineering', seconds, peak, rss_delta, len(df_cleaned))
+
+    # Training writes its artifacts in a temporary directory, the trained model of src/ is left untouched
+    df_model = df_engineered[predominant_features + ['price']]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as artifacts:
+        os.chdir(artifacts)
+        try:
+            _, seconds, peak, rss_delta = measure(main, df_model, memory=memory, repeat=repeat)
+            record('modeling.main', seconds, peak, rss_delta, len(df_model))
+
+            registry = ModelRegistry(os.path.join(artifacts, 'trained_model.joblib'), os.path.join(artifacts, 'trained_scaler.joblib'))
+            registry.model, registry.scaler  # loaded outside of the timing
+            _, seconds, peak, rss_delta = measure(predict_price, df_engineered, registry, memory=memory, repeat=repeat)
+            record('predict_price', seconds, peak, rss_delta, len(df_engineered))
+        finally:
+            os.chdir(cwd)
+
+    return results
+
+def environment():
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'sklearn': sklearn.__version__
+    }
+
+def compare(results, baseline, tolerance=0.2, min_memory_mb=20):
+    # Slowdowns larger than tolerance (relative rows/s) against the baseline, for the stages and sizes in both,
+    # and peak RSS growth larger than tolerance for the stages using at least min_memory_mb (smaller ones are noise)
+    reference = {(result['stage'], result['rows']): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        previous = reference.get((result['stage'], result['rows']))
+        if previous is None:
+            continue
+        ratio = result['rows_per_sec'] / previous['rows_per_sec']
+        flag = ' REGRESSION' if ratio < 1 - tolerance else ''
+        line = f"{result['stage']:>20} {result['rows']:>9} rows: {ratio:6.2f}x baseline throughput"
+
+        rss, previous_rss = result.get('peak_rss_delta_mb'), previous.get('peak_rss_delta_mb')
+        if rss is not None and previous_rss is not None and max(rss, previous_rss) >= min_memory_mb:
+            memory_ratio = rss / max(previous_rss, 1)
+            line += f", {memory_ratio:6.2f}x baseline peak RSS"
+            if memory_ratio > 1 + tolerance:
+                flag += ' MEMORY REGRESSION'
+
+        print(line + flag)
+        if flag:
+            regressions.append(result)
+
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--output', default=None, help='JSON file to write the results to')
+    parser.add_argument('--baseline', default=None, help='JSON results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='accepted relative drop of rows/s')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced run measuring peak memory')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    results = [result for rows in args.rows for result in run(rows, not args.no_memory, args.seed)]
+    if not args.no_memory:
+        print(f"Memory: {memory_notes}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'notes': memory_notes, 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,131 @@
+# Synthetic Centris listings in the raw French format of data/train.csv (and data/listings.csv)
+# Values are drawn around the ranges of the real plexes, formats match the scraped text exactly:
+#   "840 000 $", "4 662,92 pc /    433,2 mc", "25 X 100 p / 7,62 X 30,48 m", "Allée (1), Garage (2)"
+import numpy as np
+import pandas as pd
+
+districts = ['Rosemont', 'Mercier/Hochelaga', 'Villeray/S Michel', 'Ahuntsic', 'LaSalle', 'Le Sud Ouest', 'Verdun/Île-des-Soeurs',
+             'Plateau Mont-Royal', 'Montréal-Nord', 'Saint-Léonard', 'Côte-des-Neiges', 'Lachine', 'Anjou', 'Saint-Laurent',
+             'Rivière-des-Prairies', 'Pointe-aux-Trembles', 'Ville-Marie', 'Outremont', 'Montréal-Est', 'Mont-Royal']
+building_types = ['Jumelé', 'En rangée', 'Isolé (détaché)', 'En rangée sur coin']
+plex_names = {2: 'Duplex', 3: 'Triplex', 4: 'Quadruplex', 5: 'Quintuplex', 6: 'Sextuplex'}
+heating_types = ['Plinthes électriques', 'Eau chaude', 'Plinthes à convection', 'Air soufflé (pulsé)', 'Radiant', 'Thermopompe',
+                 'Gaz naturel', 'Poêle à bois']
+services = ['Climatiseur mural', 'Thermopompe murale', 'Thermopompe centrale', "Détecteur d'incendie (non relié)", 'Buanderie',
+            'Aspirateur central', 'Ascenseur(s)', "Échangeur d'air", "Système d'alarme", 'Porte de garage électrique', 'Borne de recharge']
+renovation_types = ['Revêtement de la toiture', 'Fenêtres', 'Salle de bain', 'Cuisine', 'Plomberie', 'Électricité', 'Fondation']
+water_names = ['Fleuve St-Laurent', 'Rivière des Prairies', 'Canal de Lachine', 'municipal', 'Ville']
+pools = ['Hors terre', 'Creusée', 'Chauffée, Creusée', 'Chauffée, Hors terre', 'Spa']
+fireplaces = ['Foyer au bois', 'Foyer au gaz', 'Poêle au bois', 'Poêle au gaz', 'Poêle aux granules', 'Foyer non fonctionnel']
+water_access = ['Accès (Canal)', 'Accès (Rivière)', "Accès (Rivière), Bordé par l'eau (Rivière), Navigable", 'Non navigable']
+inclusions = ['Selon les baux', '3 chauffe-eau', 'Luminaires', "Toutes les installations permanentes de chauffage et d'éclairage",
+              'Laveuse, sécheuse', 'Réfrigérateur, cuisinière']
+exclusions = ['Effets personnels des locataires', 'Les effets personnels des locataires', 'Biens des locataires',
+              'Tous les biens des locataires']
+remarks = ["Magnifique {plex} situé dans le quartier {district}, à proximité des écoles, des parcs et du transport en commun.",
+           "Excellent investissement! {plex} bien entretenu, revenus stables et locataires de longue date.",
+           "{plex} rénové au goût du jour, près du métro et de toutes les commodités de {district}.",
+           "Rare sur le marché, {plex} sur un grand terrain avec stationnement et cour arrière aménagée."]
+addenda = ["Les baux sont transférables. Les dépenses incluent les taxes municipales et scolaires ainsi que les assurances. ",
+           "Toiture refaite, fenêtres changées, entrées électriques de 100 ampères. Visites sur rendez-vous seulement. ",
+           "Le vendeur ne donne aucune garantie légale de qualité, aux risques et périls de l'acheteur. "]
+
+def french_number(values, decimals=0, strip=True):
+    # 4662.92 -> "4 662,92", 232.30 -> "232,3", 209.0 -> "209" (spaces between thousands, comma for decimals)
+    formatted = [f"{value:,.{decimals}f}" for value in np.round(values, decimals)]
+    if decimals and strip:
+        formatted = [text.rstrip('0').rstrip('.') for text in formatted]
+    return pd.Series(formatted, dtype=object).str.replace(',', ' ', regex=False).str.replace('.', ',', regex=False)
+
+def money(values):
+    # 840000 -> "840 000 $"
+    return french_number(values) + ' $'
+
+def area(square_feet):
+    # "2 972,99 pc /    276,2 mc"
+    return french_number(square_feet, 2) + ' pc /    ' + french_number(square_feet * 0.09290304, 2) + ' mc'
+
+def dimensions(width, length):
+    # "25 X 100 p / 7,62 X 30,48 m"
+    return (french_number(width) + ' X ' + french_number(length) + ' p / ' +
+            french_number(width * 0.3048, 2, strip=False) + ' X ' + french_number(length * 0.3048, 2, strip=False) + ' m')
+
+def comma_list(rng, choices, rows, max_items, prob):
+    # "a, b" lists of distinct choices, NaN for a share 1 - prob of the rows
+    picks = rng.random((rows, len(choices))) < max_items / len(choices)
+    picks &= (rng.random(rows) < prob)[:, None]
+    text = pd.Series([', '.join(np.array(choices)[row]) for row in picks], dtype=object)
+    return text.where(text != '')
+
+def sometimes(rng, values, prob):
+    # Keeps a share prob of the values, NaN elsewhere
+    values = pd.Series(values, dtype=object)
+    return values.where(rng.random(len(values)) < prob)
+
+def generate_listings(rows, seed=0, listing_format=False):
+    # listing_format adds the lat/lon/Ville columns of data/listings.csv (ID_cust instead of ID)
+    rng = np.random.default_rng(seed)
+    units = rng.choice([2, 3, 4, 5, 6], rows, p=[0.45, 0.35, 0.1, 0.06, 0.04])
+    year = rng.integers(1900, 2020, rows)
+    district = rng.choice(districts, rows)
+    plex = pd.Series([plex_names[unit] for unit in units], dtype=object)
+
+    # Prices and evaluations, correlated with the number of units
+    build_eval = np.round(units * rng.normal(140000, 30000, rows).clip(60000), -2)
+    land_eval = np.round(rng.normal(220000, 70000, rows).clip(50000), -2)
+    price = np.round((build_eval + land_eval) * rng.normal(1.25, 0.12, rows).clip(0.8), -3).clip(100000)
+    income = np.round(units * rng.normal(13500, 2500, rows).clip(6000), -2)
+
+    # Building and land areas, in feet
+    building_width, building_length = rng.integers(20, 45, rows), rng.integers(30, 60, rows)
+    land_width, land_length = rng.integers(22, 60, rows), rng.integers(70, 130, rows)
+    living_area = building_width * building_length * rng.uniform(1.5, 2.5, rows) + rng.uniform(0, 1, rows).round(2)
+    land_area = land_width * land_length + rng.uniform(0, 1, rows).round(2)
+
+    parking = ['Allée ({}), Garage ({})'.format(a, g) if a and g else 'Allée ({})'.format(a) if a else 'Garage ({})'.format(g) if g else None
+               for a, g in zip(rng.integers(0, 4, rows), rng.integers(0, 3, rows))]
+    certificate_year = rng.integers(1995, 2025, rows)
+    certificate = pd.Series(np.where(rng.random(rows) < 0.4, 'Non', [f'Oui ({y})' for y in certificate_year]), dtype=object)
+    renovations = pd.Series(rng.choice(renovation_types, rows), dtype=object) + ' - ' + pd.Series(rng.integers(1990, 2024, rows)).astype(str)
+    rooms = units * rng.integers(2, 4, rows) + rng.integers(0, 2, rows)
+
+    df = pd.DataFrame({
+        'ID': np.arange(1, rows + 1),
+        'Prix': money(price),
+        'District': district,
+        'Un. rés.': units,
+        'Rev. brut. pot.': money(income),
+        'YearBuilt': plex + ' construit en ' + pd.Series(year).astype(str),
+        'Type de bâtiment': rng.choice(building_types, rows),
+        'Dimensions du bâtiment': sometimes(rng, dimensions(building_width, building_length), 0.96),
+        'Éval. terrain': money(land_eval),
+        'Superficie habitable': sometimes(rng, area(living_area), 0.3),
+        'Éval. bâtiment': money(build_eval),
+        'Dimensions du terrain': sometimes(rng, dimensions(land_width, land_length), 0.86),
+        'Cert. de localisation': certificate,
+        'Superficie du terrain': sometimes(rng, area(land_area), 0.96),
+        "Plan d'eau": sometimes(rng, rng.choice(water_names, rows), 0.04),
+        'Piscine': sometimes(rng, rng.choice(pools, rows), 0.04),
+        'Stationnement (total)': sometimes(rng, parking, 0.75),
+        'Chauffage': comma_list(rng, heating_types, rows, 1.5, 0.86),
+        'Eau (accès)': sometimes(rng, rng.choice(water_access, rows), 0.01),
+        'Foyers-Poêles': sometimes(rng, rng.choice(fireplaces, rows), 0.08),
+        'Équip./Serv.': comma_list(rng, services, rows, 2, 0.33),
+        'Rénovations': sometimes(rng, renovations, 0.16),
+        'Inclusions': sometimes(rng, rng.choice(inclusions, rows), 0.8),
+        'Exclusions': sometimes(rng, rng.choice(exclusions, rows), 0.66),
+        'Remarques - Courtier': sometimes(rng, [remarks[i].format(plex=p, district=d) for i, p, d in
+                                                zip(rng.integers(0, len(remarks), rows), plex, district)], 0.92),
+        'Addenda': sometimes(rng, [''.join(addenda[:n]) for n in rng.integers(1, len(addenda) + 1, rows)], 0.82),
+        'Nbre pièces': rooms.astype(float),
+        'Nbre chambres (hors-sol + sous-sol)': (units * rng.integers(1, 3, rows)).clip(1, 8).astype(float),
+        "Nbre salles de bains + salles d'eau": [f'{b}+{w}' for b, w in zip(units // 2 + rng.integers(0, 2, rows), rng.integers(0, 2, rows))]
+    })
+
+    if listing_format:
+        df = df.rename(columns={'ID': 'ID_cust'})
+        df['lat'] = rng.normal(45.55, 0.05, rows).round(6)
+        df['lon'] = rng.normal(-73.62, 0.07, rows).round(6)
+        df['Ville'] = 'Montréal'
+
+    return df
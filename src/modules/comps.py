@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree, BallTree
+from joblib import dump, load
+from modules.data_loading import key_columns
+
+# Comparable sold listings ("comps"): nearest neighbours on the scaled features used by the model
+class CompsIndex:
+    def __init__(self, features=None, leaf_size=40, tree='kd_tree'):
+        # Defaults to the scaler features, i.e. the predominant features of predict_price
+        self.features = features
+        self.leaf_size = leaf_size
+        self.tree = tree
+
+    def fit(self, df, scaler):
+        # df holds the sold listings with their price, the key column when present (its index otherwise)
+        self.features_ = list(self.features or scaler.feature_names_in_)
+        self.scaler_ = scaler
+        self.key_ = next((col for col in key_columns if col in df.columns), None)
+        self.ids_ = (df[self.key_] if self.key_ else df.index.to_series()).to_numpy()
+        self.prices_ = df['price'].to_numpy()
+
+        # O(log n) queries instead of a scan of every sold listing
+        Tree = KDTree if self.tree == 'kd_tree' else BallTree
+        self.tree_ = Tree(self._scale(df), leaf_size=self.leaf_size)
+
+        return self
+
+    def _scale(self, df):
+        X = df.reindex(columns=self.scaler_.feature_names_in_)
+        return pd.DataFrame(self.scaler_.transform(X), columns=self.scaler_.feature_names_in_)[self.features_].to_numpy()
+
+    def query(self, listings, k=5, exclude_self=True):
+        # Batched k-NN: (ids, distances, prices), each of shape (len(listings), k)
+        k = min(k, len(self.ids_))
+        extra = 1 if exclude_self and self.key_ in listings.columns else 0
+        distances, neighbours = self.tree_.query(self._scale(listings), k=min(k + extra, len(self.ids_)))
+
+        if extra:
+            # A listing is not its own comp, the other neighbours move up one rank
+            is_self = self.ids_[neighbours] == listings[self.key_].to_numpy()[:, None]
+            order = np.argsort(is_self, axis=1, kind='stable')[:, :k]
+            neighbours = np.take_along_axis(neighbours, order, axis=1)
+            distances = np.take_along_axis(distances, order, axis=1)
+
+        return self.ids_[neighbours], distances, self.prices_[neighbours]
+
+    def transform(self, listings, k=5, exclude_self=True):
+        # Listings with comp_1_ID, comp_1_distance, comp_1_price, ... columns appended
+        ids, distances, prices = self.query(listings, k, exclude_self)
+        comps = {}
+        for j in range(ids.shape[1]):
+            comps[f'comp_{j + 1}_{self.key_ or "index"}'] = ids[:, j]
+            comps[f'comp_{j + 1}_distance'] = distances[:, j]
+            comps[f'comp_{j + 1}_price'] = prices[:, j]
+
+        return pd.concat([listings.reset_index(drop=True), pd.DataFrame(comps)], axis=1)
+
+    def save(self, path='trained_comps.joblib'):
+        dump(self, path)
+
+    @staticmethod
+    def load(path='trained_comps.joblib'):
+        return load(path)
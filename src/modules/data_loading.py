@@ -1,5 +1,11 @@
+import os
+import glob
+import hashlib
 import pandas as pd
 
+# Columns identifying a listing, by order of preference
+key_columns = ['No Centris', 'ID_cust', 'ID']
+
 def load_train_data():
     return pd.read_csv('../data/train.csv', index_col=None)
 
@@ -7,4 +13,58 @@ def load_listings_data():
     return pd.read_csv('../data/listings.csv', index_col=None)
 
 def load_full_data():
-    return pd.read_csv('../data/custom_listings.csv', index_col=None)
\ No newline at end of file
+    return pd.read_csv('../data/custom_listings.csv', index_col=None)
+
+def load_listings_chunks(chunksize=10000, path='../data/listings.csv'):
+    return pd.read_csv(path, index_col=None, chunksize=chunksize)
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def frame_hash(df, *extra):
+    # sha256 of the values, index and columns of a frame (row order included), and of any extra parameters
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest.update(repr((list(df.columns), *extra)).encode('utf-8'))
+
+    return digest.hexdigest()
+
+# Cache of cleaned / engineered frames (Feather), keyed by the input file content and the preprocessing code
+def pipeline_version():
+    from modules import data_preprocessing
+    return file_hash(data_preprocessing.__file__)
+
+def load_cached_data(path='../data/train.csv', stage='engineered', cache_dir='../data/cache', memory_map=False):
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    from modules.data_preprocessing import clean_data, feature_engineering
+    if stage not in ('cleaned', 'engineered'):
+        raise ValueError(f"Unknown stage: {stage}, expected 'cleaned' or 'engineered'")
+
+    # Any change to the CSV or to data_preprocessing.py gives a new key
+    key = hashlib.sha256(f'{file_hash(path)}:{pipeline_version()}:{stage}'.encode()).hexdigest()[:16]
+    prefix = os.path.join(cache_dir, f'{os.path.splitext(os.path.basename(path))[0]}_{stage}_')
+    cache_path = f'{prefix}{key}.feather'
+
+    # Warm load, no parsing. With memory_map, the numeric and string columns of the frame are zero-copy views of the
+    # mapped file (uncompressed, one record batch, one block per column): pages are read on access, not held in memory
+    if os.path.exists(cache_path):
+        table = feather.read_table(cache_path, memory_map=memory_map)
+        return table.to_pandas(split_blocks=True, self_destruct=True) if memory_map else table.to_pandas()
+
+    df = clean_data(pd.read_csv(path, index_col=None))
+    if stage == 'engineered':
+        df = feature_engineering(df)
+
+    # Replace the stale entries of this file and stage
+    os.makedirs(cache_dir, exist_ok=True)
+    for stale_path in glob.glob(f'{glob.escape(prefix)}*.feather'):
+        os.remove(stale_path)
+    feather.write_feather(pa.Table.from_pandas(df, preserve_index=True), cache_path, compression='uncompressed', chunksize=max(len(df), 1))
+
+    return df
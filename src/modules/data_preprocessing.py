@@ -1,13 +1,219 @@
+import os
 import pandas as pd
 import numpy as np
-import re
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import csr_matrix
+from sklearn.neighbors import KDTree
+from joblib import dump, load
+from modules.data_loading import key_columns
+from modules.instrumentation import stage
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Column-wise parsers used by clean_data (vectorized .str operations, no per-row apply)
+def as_text(col):
+    # A column with only missing values is read as float (e.g. in a streamed chunk), parse it as text
+    return col if pd.api.types.is_string_dtype(col) else col.astype(object)
+
+def first_measure(col):
+    # First number before the '/' (e.g. "2 972,99 pc / 276,2 mc" -> 2972.99)
+    match = as_text(col).str.extract(r'^[^/\d\s,]*([\d\s,]+)', expand=False)
+    match = match.where(match.str.strip().str.len() > 0)
+
+    return match.str.replace(',', '.', regex=False).str.replace(' ', '', regex=False).astype(float)
+
+def dimensions_product(col):
+    # Product of the first two numbers before the '/' (e.g. "25 X 100 p / 7,62 X 30,48 m" -> 2500.0)
+    # Atomic groups keep the same number boundaries as re.findall(r'(\d+,\d+|\d+)')
+    numbers = as_text(col).str.extract(r'^[^/\d]*((?>\d+,\d+|\d+))[^/\d]*((?>\d+,\d+|\d+))')
+    width = numbers[0].str.replace(',', '.', regex=False).astype(float)
+    length = numbers[1].str.replace(',', '.', regex=False).astype(float)
+
+    return width * length
+
+def match_mapping(col, mapping):
+    # Presence flag and first mapped name (in mapping order) found in the lowercased text
+    lower = as_text(col).str.lower()
+    present = col.notna() & (lower != 'none')
+    conditions = [present & lower.str.contains(key, regex=False, na=False) for key in mapping]
+    names = np.select(conditions, list(mapping.values()), default=None)
+
+    return present.astype(int), pd.Series(names, index=col.index)
+
+def reduce_matches(col, pattern, how='sum'):
+    # Sum (or max, ...) of every integer captured by pattern, 0 when there is no match
+    matches = as_text(col).reset_index(drop=True).str.extractall(pattern)[0].astype(int)
+    totals = matches.groupby(level=0).agg(how).reindex(range(len(col)), fill_value=0)
+
+    return pd.Series(totals.to_numpy(), index=col.index)
+
+# Services
+custom_services = ['Porte de garage électrique', 'Buanderie', 'Climatiseur', 'Aspirateur centrale' , 'Spa', "Détecteur d'incendie (relié)", 
+                   "Détecteur d'incendie (non relié)", 'Adapté pour personne à mobilité réduite', 'Interphone', 'Fournaise', 'Thermopompe', 
+                   'Planchers chauffant', 'Ascenseur', "Échangeur d'air", 'Fournaise', "Système d'alarme",'Borne de recharge']
+
+keyword_mapping = {
+    'garage': 'Porte de garage électrique',
+    'climatiseur': 'Climatiseur',
+    'climatisation': 'Climatiseur',
+    'buanderie': 'Buanderie',
+    'aspirateur': 'Aspirateur centrale',
+    'thermo': 'Thermopompe',
+    'thermopompe': 'Thermopompe',
+    'planchers chauffant': 'Planchers chauffant',
+    'fournaise': 'Fournaise',
+    'spa': 'Spa',
+    'ascenseur(s)': 'Ascenseur',
+    'borne': 'Borne de recharge',
+
+}
+
+# Multi-hot encoder for the comma separated 'Équip./Serv.' field
+class ServiceEncoder:
+    def __init__(self, services=custom_services, aliases=keyword_mapping, min_frequency=None):
+        self.services = list(dict.fromkeys(services))
+        self.aliases = aliases
+        # Raw tokens seen at least min_frequency times without matching a service get their own column
+        self.min_frequency = min_frequency
+
+    def _match(self, token):
+        # Exact service name first, otherwise every keyword alias contained in the token
+        if token in self.services:
+            return [token]
+        return list(dict.fromkeys(service for keyword, service in self.aliases.items() if keyword in token.lower()))
+
+    @staticmethod
+    def _tokenize(col):
+        tokens = as_text(col).reset_index(drop=True).str.split(',').explode().dropna().astype(str).str.strip()
+        codes, uniques = pd.factorize(tokens)
+
+        return tokens.index.to_numpy(), codes, uniques
+
+    def fit(self, col):
+        _, codes, uniques = self._tokenize(col)
+        self.columns_ = list(self.services)
+        self.vocabulary_ = {token: self._match(token) for token in uniques}
+
+        if self.min_frequency is not None:
+            counts = np.bincount(codes, minlength=len(uniques))
+            for token, count in zip(uniques, counts):
+                if not self.vocabulary_[token] and token and count >= self.min_frequency:
+                    self.vocabulary_[token] = [token]
+                    self.columns_.append(token)
+
+        return self
+
+    def transform(self, col, sparse=False):
+        rows, codes, uniques = self._tokenize(col)
+        column_index = {column: i for i, column in enumerate(self.columns_)}
+
+        # Token -> columns indicator, built once per unique token
+        token_rows, token_cols = [], []
+        for i, token in enumerate(uniques):
+            matched = self.vocabulary_[token] if token in self.vocabulary_ else self._match(token)
+            for column in matched:
+                if column in column_index:
+                    token_rows.append(i)
+                    token_cols.append(column_index[column])
+        token_matrix = csr_matrix((np.ones(len(token_rows), dtype=np.int64), (token_rows, token_cols)), shape=(len(uniques), len(self.columns_)))
+
+        # Listing -> tokens indicator, then a single sparse product gives listing -> columns
+        listing_matrix = csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, codes)), shape=(len(col), len(uniques)))
+        encoded = (listing_matrix @ token_matrix).tocsr()
+        encoded.data[:] = 1
+
+        if sparse:
+            return encoded
+        return pd.DataFrame(encoded.toarray(), index=col.index, columns=self.columns_)
+
+    def fit_transform(self, col, sparse=False):
+        return self.fit(col).transform(col, sparse=sparse)
+
+    def save(self, path):
+        dump(self, path)
+
+    @staticmethod
+    def load(path):
+        return load(path)
+
+# Compact dtypes of the cleaned and engineered frames (compact=True)
+## 0/1 flags as int8, small counts and years as int8/int16, money as int32, measurements as float32, labels as category
+cleaned_schema = {
+    'price': 'int32', 'income': 'int32', 'build_eval': 'int32', 'land_eval': 'int32',
+    'units': 'int8', 'rooms': 'float32', 'bedrooms': 'float32', 'washrooms': 'int8', 'total_parking': 'int16',
+    'year_built': 'int16', 'year_certificate': 'int16', 'living_area': 'float32', 'yard_area': 'float32',
+    'has_certificate': 'int8', 'due_certificate': 'int8', 'near_water': 'int8', 'has_pool': 'int8',
+    'District': 'category', 'build_type': 'category', 'water_name': 'category', 'pool_type': 'category', 'Chauffage': 'category'
+}
+
+engineered_schema = {
+    **cleaned_schema,
+    **dict.fromkeys(['Plinthes électriques', 'Convecteurs', 'Eau chaude', 'Air soufflé (pulsé)', 'Radiant', 'Thermopompe', 'Gaz naturel',
+                     'Poêle à bois', 'Foyer au gaz', 'water_access', 'has_fireplace', 'fireplace_func', 'has_reno'], 'int8'),
+    'last_year_reno': 'int16', 'build_age': 'int16', 'min_price': 'int32', 'max_price': 'int32',
+    'knn_mean_price': 'float32', 'knn_median_price': 'float32', 'knn_distance_km': 'float32', 'radius_count': 'int32',
+    'radius_mean_price': 'float32'
+}
+
+## Raw French text already parsed into columns by clean_data and by feature_engineering
+cleaned_raw_columns = ['YearBuilt', 'Dimensions du bâtiment', 'Superficie habitable', 'Dimensions du terrain', 'Cert. de localisation',
+                       'Superficie du terrain', "Plan d'eau", 'Piscine', 'Stationnement (total)']
+engineered_raw_columns = cleaned_raw_columns + ['Eau (accès)', 'Foyers-Poêles', 'Équip./Serv.']
+
+def compact_frame(df, schema, drop=()):
+    # Casts the columns of the schema present in df, integer columns with missing values become float32
+    casts = {}
+    for col, dtype in schema.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if dtype.startswith('int') and df[col].isna().any():
+            dtype = 'float32'
+        casts[col] = dtype
+
+    return df.drop(columns=[col for col in drop if col in df.columns]).astype(casts)
+
+# Parallel mode: row-local stages run on partitions of the frame in a process pool
+def resolve_workers(workers):
+    # None or 1: serial, -1: one worker per core
+    return os.cpu_count() or 1 if workers == -1 else workers or 1
+
+def map_partitions(function, df, workers, *args):
+    # Applies function(partition, *args) to contiguous partitions of df and concatenates the results in order
+    partitions = [df.iloc[indices] for indices in np.array_split(np.arange(len(df)), workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(function, partitions, *[[arg] * workers for arg in args]))
+
+    # A partition can infer another dtype for a column (e.g. only missing values), keep the dtype of the non-empty parts
+    combined = pd.concat(results)
+    for col in combined.columns:
+        dtypes = [result[col].dtype for result in results if result[col].notna().any()]
+        if dtypes and all(dtype == dtypes[0] for dtype in dtypes) and combined[col].dtype != dtypes[0]:
+            combined[col] = combined[col].astype(dtypes[0])
+
+    return combined
 
 # Mix of cleaning and feature engineering
-def clean_data(df):
-    df_cleaned = df.copy()
-    # Column naming
-    df_cleaned.rename(columns={
+def clean_data(df, compact=False, workers=None):
+    # compact: compact dtypes and raw text columns dropped once parsed
+    # workers: processes parsing partitions of the rows, the dropna and casts run once on the combined result
+    workers = min(resolve_workers(workers), max(len(df), 1))
+    with stage('clean_data', df) as record:
+        if workers > 1:
+            df_cleaned = _finish_cleaning(map_partitions(_parse_rows, df, workers))
+        else:
+            df_cleaned = _clean_data(df)
+        if compact:
+            df_cleaned = compact_frame(df_cleaned, cleaned_schema, cleaned_raw_columns)
+        return record.output(df_cleaned)
+
+def _clean_data(df):
+    return _finish_cleaning(_parse_rows(df))
+
+def _parse_rows(df):
+    # Column naming (a new frame sharing the data of df, no full copy)
+    df_cleaned = df.rename(columns={
         'Prix': 'price',
         'Un. rés.': 'units',
         'Rev. brut. pot.': 'income',
@@ -22,69 +228,49 @@ def clean_data(df):
         'Nbre pièces': 'rooms',
         'Nbre chambres (hors-sol + sous-sol)': 'bedrooms',
         "Nbre salles de bains + salles d'eau": 'washrooms'
-    }, inplace=True)
+    })
 
-    print(df_cleaned.columns)
+    logger.debug('clean_data columns: %s', list(df_cleaned.columns))
     
     # Datatypes
-    for col in ['price', 'income', 'build_eval', 'land_eval']:
-        #df_cleaned[col] = df_cleaned[col].str.replace('[\$, ]', '', regex=True).fillna(0).astype(int)
-        df_cleaned[col] = df_cleaned[col].str.replace('[\$, ]', '', regex=True).str.split('+').str[0].fillna(0).astype(int)
+    with stage('clean_data.money', df_cleaned):
+        for col in ['price', 'income', 'build_eval', 'land_eval']:
+            #df_cleaned[col] = df_cleaned[col].str.replace('[\$, ]', '', regex=True).fillna(0).astype(int)
+            df_cleaned[col] = as_text(df_cleaned[col]).str.replace('[\$, ]', '', regex=True).str.split('+').str[0].fillna(0).astype(int)
 
     # Extract year of construction
-    def extract_year(row):
-        year_match = re.search(r'\b\d{4}\b', row)
-
-        return int(year_match.group()) if year_match else None
+    def extract_year(col):
+        return as_text(col).str.extract(r'\b(\d{4})\b', expand=False).astype(float)
 
     # Filling missing value for living_area using building dimension
-    def extract_living_area(row):
-        # Extract living area if available
-        if pd.notna(row['Superficie habitable']):
-            match = re.search(r'([\d\s,]+)', row['Superficie habitable'].split('/')[0])
-            if match and match.group(1).strip():
-                return float(match.group(1).replace(',', '.').replace(' ', ''))
-    
-        # If living area is not available, use dimensions to calculate it
-        if pd.notna(row['Dimensions du bâtiment']):
-            match = re.findall(r'(\d+,\d+|\d+)', row['Dimensions du bâtiment'].split('/')[0])
-            if len(match) >= 2:
-                return float(match[0].replace(',', '.')) * float(match[1].replace(',', '.')) * row['units']
-        
-        return np.nan
+    def extract_living_area(df):
+        # Extract living area if available, otherwise use dimensions to calculate it
+        living_area = first_measure(df['Superficie habitable'])
+        from_dimensions = dimensions_product(df['Dimensions du bâtiment']) * df['units']
+
+        return living_area.combine_first(from_dimensions)
 
     # Filling missing value for yard_area using land dimension
-    def extract_yard_area(row):
-        # Extract yard area if available
-        if pd.notna(row['Superficie du terrain']):
-            match = re.search(r'([\d\s,]+)', row['Superficie du terrain'].split('/')[0])
-            if match and match.group(1).strip():
-                return float(match.group(1).replace(',', '.').replace(' ', ''))
-    
-        # If yard area is not available, use dimensions to calculate it
-        if pd.notna(row['Dimensions du terrain']):
-            match = re.findall(r'(\d+,\d+|\d+)', row['Dimensions du terrain'].split('/')[0])
-            if len(match) >= 2:
-                return float(match[0].replace(',', '.')) * float(match[1].replace(',', '.'))
-    
-        return np.nan
+    def extract_yard_area(df):
+        # Extract yard area if available, otherwise use dimensions to calculate it
+        yard_area = first_measure(df['Superficie du terrain'])
+        from_dimensions = dimensions_product(df['Dimensions du terrain'])
+
+        return yard_area.combine_first(from_dimensions)
 
     # Extract certificate boolean and year (and overdue status)
-    def extract_certificate_info(row):
-        has_certificate = 0
-        year_certificate = 0
-        due_certificate = 0
-    
-        if 'Oui' in row:
-            has_certificate = 1
-            match = re.search(r'\((\d{4})\)', row)
-            if match:
-                year_certificate = int(match.group(1))
-                current_year = datetime.now().year
-                if current_year - year_certificate > 10:
-                    due_certificate = 1
-                
-        return pd.Series([has_certificate, year_certificate, due_certificate], index=['has_certificate', 'year_certificate', 'due_certificate'])
+    def extract_certificate_info(col):
+        has_certificate = as_text(col).str.contains('Oui', regex=False, na=False)
+        year_match = as_text(col).str.extract(r'\((\d{4})\)', expand=False).where(has_certificate)
+        year_certificate = year_match.fillna(0).astype(int)
+        current_year = datetime.now().year
+        due_certificate = year_match.notna() & (current_year - year_certificate > 10)
+
+        return pd.DataFrame({
+            'has_certificate': has_certificate.astype(int),
+            'year_certificate': year_certificate,
+            'due_certificate': due_certificate.astype(int)
+        }, index=col.index)
 
     ## Mapping of similar or translated terms to standard names for water
     map_water = {
@@ -109,20 +295,10 @@ def clean_data(df):
         'louis veuillot': 'Louis Veuillot'
     }
 
-    def standardize_water(row):
-        near_water = 0
-        water_name = None
-    
-        if pd.notna(row):
-            row_lower = row.lower()
-            if row_lower != 'none':
-                near_water = 1
-                for key, value in map_water.items():
-                    if key in row_lower:
-                        water_name = value
-                        break
-                
-        return pd.Series([near_water, water_name], index=['near_water', 'water_name'])
+    def standardize_water(col):
+        near_water, water_name = match_mapping(col, map_water)
+
+        return pd.DataFrame({'near_water': near_water, 'water_name': water_name}, index=col.index)
     
     # Pool info
     map_pool = {
@@ -142,28 +318,16 @@ def clean_data(df):
         'chauffée au mazout': 'Chauffée au mazout'
     }
     
-    def standardize_pool(row):
-        has_pool = 0
-        pool_type = None
-    
-        if pd.notna(row):
-            row_lower = row.lower()
-            if row_lower != 'none':
-                has_pool = 1
-                for key, value in map_pool.items():
-                    if key in row_lower:
-                        pool_type = value
-                        break
-                
-        return pd.Series([has_pool, pool_type], index=['has_pool', 'pool_type'])
+    def standardize_pool(col):
+        has_pool, pool_type = match_mapping(col, map_pool)
+
+        return pd.DataFrame({'has_pool': has_pool, 'pool_type': pool_type}, index=col.index)
 
     # Extract total parking lot
-    def total_parking(row):
-        if pd.isna(row):
-            return 1
-        numbers = re.findall(r'\((\d+)\)', row)
+    def total_parking(col):
+        parking = reduce_matches(col, r'\((\d+)\)', 'sum')
 
-        return sum(int(num) for num in numbers)
+        return parking.where(col.notna(), 1)
 
     # Cleaning type of heating
     map_heating = {
@@ -181,25 +345,38 @@ def clean_data(df):
     }
 
     # Standardize the 'Chauffage' column and fill NaN with 'Plinthes électriques'
-    df_cleaned['Chauffage'] = (
-        df_cleaned['Chauffage']
-        .apply(lambda x: ', '.join([map_heating.get(item.strip().lower(), item.strip()) for item in x.split(',')]) if pd.notna(x) else 'Plinthes électriques')
-    )
+    with stage('clean_data.heating', df_cleaned):
+        df_cleaned['Chauffage'] = (
+            df_cleaned['Chauffage']
+            .apply(lambda x: ', '.join([map_heating.get(item.strip().lower(), item.strip()) for item in x.split(',')]) if pd.notna(x) else 'Plinthes électriques')
+        )
 
     # Total washrooms
-    df_cleaned['washrooms'] = df_cleaned['washrooms'].apply(lambda x: sum(int(item) for item in x.split('+')) if pd.notna(x) else 0)
+    with stage('clean_data.washrooms', df_cleaned):
+        df_cleaned['washrooms'] = df_cleaned['washrooms'].apply(lambda x: sum(int(item) for item in x.split('+')) if pd.notna(x) else 0)
 
     # Apply custom functions
-    df_cleaned['year_built'] = df_cleaned['YearBuilt'].apply(extract_year)
-    df_cleaned['living_area'] = df_cleaned.apply(extract_living_area, axis=1)
-    df_cleaned['yard_area'] = df_cleaned.apply(extract_yard_area, axis=1)
-    df_cleaned[['has_certificate', 'year_certificate', 'due_certificate']] = df_cleaned['Cert. de localisation'].apply(extract_certificate_info)
-    df_cleaned[['near_water', 'water_name']] = df_cleaned['Plan d\'eau'].apply(standardize_water)
-    df_cleaned[['has_pool', 'pool_type']] = df_cleaned['Piscine'].apply(standardize_pool)
-    df_cleaned['total_parking'] = df_cleaned['Stationnement (total)'].apply(total_parking)
+    with stage('clean_data.year_built', df_cleaned):
+        df_cleaned['year_built'] = extract_year(df_cleaned['YearBuilt'])
+    with stage('clean_data.living_area', df_cleaned):
+        df_cleaned['living_area'] = extract_living_area(df_cleaned)
+    with stage('clean_data.yard_area', df_cleaned):
+        df_cleaned['yard_area'] = extract_yard_area(df_cleaned)
+    with stage('clean_data.certificate', df_cleaned):
+        df_cleaned[['has_certificate', 'year_certificate', 'due_certificate']] = extract_certificate_info(df_cleaned['Cert. de localisation'])
+    with stage('clean_data.water', df_cleaned):
+        df_cleaned[['near_water', 'water_name']] = standardize_water(df_cleaned['Plan d\'eau'])
+    with stage('clean_data.pool', df_cleaned):
+        df_cleaned[['has_pool', 'pool_type']] = standardize_pool(df_cleaned['Piscine'])
+    with stage('clean_data.parking', df_cleaned):
+        df_cleaned['total_parking'] = total_parking(df_cleaned['Stationnement (total)'])
+
+    return df_cleaned
 
+def _finish_cleaning(df_cleaned):
     # Drop rows where certain columns are NaN
-    df_cleaned = df_cleaned.dropna(subset=['year_built', 'living_area', 'yard_area', 'rooms'])
+    with stage('clean_data.dropna', df_cleaned) as record:
+        df_cleaned = record.output(df_cleaned.dropna(subset=['year_built', 'living_area', 'yard_area', 'rooms']))
 
     # Cast to appropriate data types
     df_cleaned['year_built'] = df_cleaned['year_built'].astype(int)
@@ -209,95 +386,213 @@ def clean_data(df):
     return df_cleaned
 
 
+# Min, mean and max price per District (fit once on the training listings)
+def compute_district_stats(df):
+    district_stats = df.groupby('District', observed=True)['price'].agg(['min', 'mean', 'max'])
+    district_stats.columns = ['min_price', 'mean_price', 'max_price']
+
+    return district_stats
+
+
+# Price statistics of the sold listings around each listing
+## lat/lon are indexed as points on the unit sphere: the straight-line (chord) distance orders neighbours
+## like the haversine distance, and a KDTree on 3 euclidean dimensions is much faster than a haversine BallTree
+class NeighbourhoodPrices:
+    earth_radius_km = 6371.0
+
+    def __init__(self, radius_km=1.0, n_neighbors=10):
+        self.radius_km = radius_km
+        self.n_neighbors = n_neighbors
+
+    @staticmethod
+    def _coordinates(df):
+        lat, lon = np.radians(df['lat'].to_numpy(dtype=float)), np.radians(df['lon'].to_numpy(dtype=float))
+        return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+    def _chord(self, km):
+        return 2 * np.sin(km / self.earth_radius_km / 2)
+
+    def _km(self, chord):
+        return 2 * self.earth_radius_km * np.arcsin(np.minimum(chord / 2, 1))
+
+    def fit(self, df):
+        # df holds the sold listings with their price, listings without coordinates are left out
+        located = df[df['lat'].notna() & df['lon'].notna()]
+        self.key_ = next((col for col in key_columns if col in df.columns), None)
+        self.ids_ = located[self.key_].to_numpy() if self.key_ else None
+        self.prices_ = located['price'].to_numpy(dtype=float)
+        self.tree_ = KDTree(self._coordinates(located))
+
+        return self
+
+    def transform(self, df):
+        features = pd.DataFrame(np.nan, index=df.index, columns=['knn_mean_price', 'knn_median_price', 'knn_distance_km',
+                                                                 'radius_count', 'radius_mean_price'])
+        located = (df['lat'].notna() & df['lon'].notna()).to_numpy()
+        if not located.any() or not len(self.prices_):
+            return features.fillna({'radius_count': 0})
+
+        X = self._coordinates(df[located])
+        # A sold listing does not count in its own neighbourhood
+        own = None
+        if self.ids_ is not None and self.key_ in df.columns:
+            own = df.loc[located, self.key_].to_numpy()
+
+        # k nearest sold listings, one extra in case the listing itself is in the index
+        k = min(self.n_neighbors + (own is not None), len(self.prices_))
+        distances, neighbours = self.tree_.query(X, k=k)
+        valid = np.ones(neighbours.shape, dtype=bool) if own is None else self.ids_[neighbours] != own[:, None]
+        valid &= np.cumsum(valid, axis=1) <= self.n_neighbors
+        prices = np.where(valid, self.prices_[neighbours], np.nan)
+        features.loc[located, 'knn_mean_price'] = np.nanmean(prices, axis=1)
+        features.loc[located, 'knn_median_price'] = np.nanmedian(prices, axis=1)
+        features.loc[located, 'knn_distance_km'] = np.nanmean(np.where(valid, self._km(distances), np.nan), axis=1)
+
+        # Sold listings within the radius, reduced per listing with flat index arrays
+        within = self.tree_.query_radius(X, r=self._chord(self.radius_km))
+        counts = np.array([len(indices) for indices in within])
+        flat = np.concatenate(within).astype(int) if counts.sum() else np.zeros(0, dtype=int)
+        rows = np.repeat(np.arange(len(X)), counts)
+        keep = np.ones(len(flat), dtype=bool) if own is None else self.ids_[flat] != own[rows]
+        radius_count = np.bincount(rows[keep], minlength=len(X))
+        radius_sum = np.bincount(rows[keep], weights=self.prices_[flat[keep]], minlength=len(X))
+        features.loc[located, 'radius_count'] = radius_count
+        features.loc[located, 'radius_mean_price'] = np.where(radius_count > 0, radius_sum / np.maximum(radius_count, 1), np.nan)
+
+        return features.fillna({'radius_count': 0})
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+
 # New features
-def feature_engineering(df):
+def feature_engineering(df, service_encoder=None, district_stats=None, neighbourhood=None, compact=False, workers=None):
+    # compact: compact dtypes and raw text columns dropped once parsed
+    # workers: processes engineering partitions of the rows, the services vocabulary and District stats are computed once
+    workers = min(resolve_workers(workers), max(len(df), 1))
+    with stage('feature_engineering', df) as record:
+        if workers > 1:
+            if service_encoder is None:
+                service_encoder = ServiceEncoder().fit(df['Équip./Serv.'])
+            if district_stats is None:
+                district_stats = compute_district_stats(df)
+            # Only the columns read by the features go to the workers, only the new columns come back
+            inputs = df[[col for col in df.columns if col in engineering_inputs]]
+            new_columns = map_partitions(_engineered_columns, inputs, workers, service_encoder, district_stats, neighbourhood)
+            df_engineered = pd.concat([df.reset_index(drop=True), new_columns.reset_index(drop=True)], axis=1)
+        else:
+            df_engineered = _feature_engineering(df, service_encoder, district_stats, neighbourhood)
+        if compact:
+            services = service_encoder.columns_ if service_encoder is not None else ServiceEncoder().services
+            df_engineered = compact_frame(df_engineered, {**engineered_schema, **dict.fromkeys(services, 'int8')}, engineered_raw_columns)
+        return record.output(df_engineered)
+
+# Columns read by _feature_engineering (with fitted services and District stats)
+engineering_inputs = ['Chauffage', 'Eau (accès)', 'Foyers-Poêles', 'Équip./Serv.', 'renovations', 'District', 'year_built', 'lat', 'lon'] + key_columns
+
+def _engineered_columns(df, service_encoder, district_stats, neighbourhood):
+    df_engineered = _feature_engineering(df, service_encoder, district_stats, neighbourhood)
+    return df_engineered[[col for col in df_engineered.columns if col not in df.columns]]
+
+def _feature_engineering(df, service_encoder=None, district_stats=None, neighbourhood=None):
     
-    df_engineered = df.copy()
+    # New columns are added to a shallow copy, the data of df is not copied
+    df_engineered = df.copy(deep=False)
 
     # List of unique heating types
     unique_heating_types = ['Plinthes électriques', 'Convecteurs', 'Eau chaude', 'Air soufflé (pulsé)', 'Radiant', 'Thermopompe', 'Gaz naturel', 'Poêle à bois', 'Foyer au gaz']
 
     # Create new columns for each heating type
-    for heating_type in unique_heating_types:
-        df_engineered[heating_type] = df_engineered['Chauffage'].apply(lambda x: 1 if heating_type.lower() in x.lower() else 0)
+    with stage('feature_engineering.heating', df_engineered):
+        heating = df_engineered['Chauffage'].str.lower()
+        for heating_type in unique_heating_types:
+            df_engineered[heating_type] = heating.str.contains(heating_type.lower(), regex=False, na=False).astype(int)
 
     # Water_access boolean
-    df_engineered['water_access'] = df_engineered['Eau (accès)'].apply(lambda x: 1 if pd.notna(x) and x != 'Non navigable' else 0)
+    with stage('feature_engineering.amenities', df_engineered):
+        water_access = df_engineered['Eau (accès)']
+        df_engineered['water_access'] = (water_access.notna() & (water_access != 'Non navigable')).astype(int)
 
-    # Fireplace boolean and condition
-    df_engineered['has_fireplace'] = df_engineered['Foyers-Poêles'].apply(lambda x: 0 if pd.isna(x) else 1)
-    df_engineered['fireplace_func'] = df_engineered['Foyers-Poêles'].apply(lambda x: 0 if pd.isna(x) else (0 if 'non' in x.lower() else 1))
+        # Fireplace boolean and condition
+        fireplace = df_engineered['Foyers-Poêles']
+        df_engineered['has_fireplace'] = fireplace.notna().astype(int)
+        df_engineered['fireplace_func'] = (fireplace.notna() & ~as_text(fireplace).str.lower().str.contains('non', regex=False, na=False)).astype(int)
 
     # Services
-    custom_services = ['Porte de garage électrique', 'Buanderie', 'Climatiseur', 'Aspirateur centrale' , 'Spa', "Détecteur d'incendie (relié)", 
-                       "Détecteur d'incendie (non relié)", 'Adapté pour personne à mobilité réduite', 'Interphone', 'Fournaise', 'Thermopompe', 
-                       'Planchers chauffant', 'Ascenseur', "Échangeur d'air", 'Fournaise', "Système d'alarme",'Borne de recharge']
-    
-    keyword_mapping = {
-        'garage': 'Porte de garage électrique',
-        'climatiseur': 'Climatiseur',
-        'climatisation': 'Climatiseur',
-        'buanderie': 'Buanderie',
-        'aspirateur': 'Aspirateur centrale',
-        'thermo': 'Thermopompe',
-        'thermopompe': 'Thermopompe',
-        'planchers chauffant': 'Planchers chauffant',
-        'fournaise': 'Fournaise',
-        'spa': 'Spa',
-        'ascenseur(s)': 'Ascenseur',
-        'borne': 'Borne de recharge',
-
-    }
+    with stage('feature_engineering.services', df_engineered):
+        ## Multi-hot encoding of the services (exact names first, then keyword aliases)
+        if service_encoder is None:
+            service_encoder = ServiceEncoder().fit(df_engineered['Équip./Serv.'])
+        services = service_encoder.transform(df_engineered['Équip./Serv.'])
+        df_engineered[list(services.columns)] = services
 
-    ## Initialize new columns with zeros
-    for service in custom_services:
-        df_engineered[service] = 0
-
-    def populate_service_columns(row):
-        if pd.notna(row):
-            for service in row.split(','):
-                service_stripped = service.strip()
-                # Check for exact match first
-                if service_stripped in custom_services:
-                    df_engineered.loc[df_engineered['Équip./Serv.'] == row, service_stripped] = 1
-                else:
-                    # Check for keyword match
-                    for keyword, mapped_service in keyword_mapping.items():
-                        if keyword in service_stripped.lower():
-                            df_engineered.loc[df_engineered['Équip./Serv.'] == row, mapped_service] = 1
     # Renovations
-
-    ## Initialize new columns
-    df_engineered['has_reno'] = 0
-    df_engineered['last_year_reno'] = 0  # Initialize with zeros instead of np.nan
-
-    ## Update new columns based on 'Rénovations'
-    for idx, row in df_engineered.iterrows():
-        if pd.notna(row['renovations']):
-            df_engineered.loc[idx, 'has_reno'] = 1
-            years = [int(year) for year in re.findall(r'\b\d{4}\b', row['renovations'])]
-            if years:
-                df_engineered.loc[idx, 'last_year_reno'] = max(years)
+    with stage('feature_engineering.renovations', df_engineered):
+        ## Flag and most recent year mentioned in 'Rénovations' (0 when no year is given)
+        df_engineered['has_reno'] = df_engineered['renovations'].notna().astype(int)
+        df_engineered['last_year_reno'] = reduce_matches(df_engineered['renovations'], r'\b(\d{4})\b', 'max')
 
     # Average, Min, Max of prices per District
-    ## Calculate min, mean, and max prices for each District
-    district_stats = df_engineered.groupby('District')['price'].agg(['min', 'mean', 'max']).reset_index()
-    
-    ## Rename columns for merging
-    district_stats.columns = ['District', 'min_price', 'mean_price', 'max_price']
-    
-    ## Merge the stats back into the original dataframe
-    df_engineered = df_engineered.merge(district_stats, on='District', how='left')
+    with stage('feature_engineering.district_stats', df_engineered):
+        ## Use the fitted stats when given, otherwise calculate them on this dataframe
+        if district_stats is None:
+            district_stats = compute_district_stats(df_engineered)
+
+        ## Indexed lookup of the stats, districts unseen at fit time get the overall range
+        stats = district_stats.reindex(df_engineered['District']).fillna({
+            'min_price': district_stats['min_price'].min(),
+            'mean_price': district_stats['mean_price'].mean(),
+            'max_price': district_stats['max_price'].max()
+        })
+        df_engineered = df_engineered.reset_index(drop=True)
+        df_engineered[list(stats.columns)] = stats.to_numpy()
 
     # Re-cast min_price and max_price to integers
     df_engineered['min_price'] = df_engineered['min_price'].astype(int)
     df_engineered['max_price'] = df_engineered['max_price'].astype(int)
 
-    # Apply functions
-    df_engineered['Équip./Serv.'].apply(populate_service_columns)
-
     # Create house ages based on year_built
-    current_year = datetime.now().year
-    df_engineered['build_age'] = df_engineered['year_built'].apply(lambda x: current_year - x)
-
-    return df_engineered
\ No newline at end of file
+    with stage('feature_engineering.build_age', df_engineered):
+        current_year = datetime.now().year
+        df_engineered['build_age'] = current_year - df_engineered['year_built']
+
+    # Prices of the nearby sold listings, when the listings have coordinates
+    if neighbourhood is not None and {'lat', 'lon'} <= set(df_engineered.columns):
+        with stage('feature_engineering.neighbourhood', df_engineered):
+            nearby = neighbourhood.transform(df_engineered)
+            df_engineered[list(nearby.columns)] = nearby
+
+    return df_engineered
+
+# Fitted feature engineering: district stats, services vocabulary and neighbourhood index are learned once on the training listings
+class FeaturePipeline:
+    def __init__(self, min_frequency=None, radius_km=1.0, n_neighbors=10, compact=False, workers=None):
+        self.min_frequency = min_frequency
+        self.radius_km = radius_km
+        self.n_neighbors = n_neighbors
+        self.compact = compact
+        self.workers = workers
+
+    def fit(self, df):
+        # df is the cleaned (and outlier filtered) training dataframe
+        self.district_stats_ = compute_district_stats(df)
+        self.service_encoder_ = ServiceEncoder(min_frequency=self.min_frequency).fit(df['Équip./Serv.'])
+        # Neighbourhood prices only when the sold listings have coordinates
+        self.neighbourhood_ = None
+        if {'lat', 'lon'} <= set(df.columns):
+            self.neighbourhood_ = NeighbourhoodPrices(self.radius_km, self.n_neighbors).fit(df)
+
+        return self
+
+    def transform(self, df):
+        return feature_engineering(df, self.service_encoder_, self.district_stats_, self.neighbourhood_, self.compact, self.workers)
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def save(self, path='trained_pipeline.joblib'):
+        dump(self, path)
+
+    @staticmethod
+    def load(path='trained_pipeline.joblib'):
+        return load(path)
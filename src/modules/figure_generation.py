@@ -1,31 +1,118 @@
+import os
+import copy
 import pandas as pd
 import numpy as np
+from joblib import dump, load
 from sklearn.preprocessing import StandardScaler
+from sklearn.decomposition import PCA
 from sklearn.manifold import TSNE
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.neighbors import KNeighborsRegressor
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report
+from sklearn.inspection import permutation_importance
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LinearRegression
 import matplotlib.pyplot as plt
+from modules.data_loading import frame_hash
 
-def TSNE_kMeans_figure(quantitatives):
-    # Initialize the scaler
-    scaler = StandardScaler()
+# t-SNE embedding and KMeans clusters, computed apart from the figure
+## The defaults reproduce the original figure, the options make it scale to large datasets:
+## PCA before t-SNE, t-SNE on a sample (the rest placed from its nearest sampled neighbours), MiniBatchKMeans
+class ClusterEmbedding:
+    def __init__(self, n_clusters=5, pca_components=None, method='barnes_hut', perplexity=30.0, n_jobs=None,
+                 sample_size=None, n_neighbors=5, minibatch=False, random_state=0, kmeans_random_state=42):
+        self.n_clusters = n_clusters
+        self.pca_components = pca_components
+        self.method = method
+        self.perplexity = perplexity
+        self.n_jobs = n_jobs
+        self.sample_size = sample_size
+        self.n_neighbors = n_neighbors
+        self.minibatch = minibatch
+        self.random_state = random_state
+        self.kmeans_random_state = kmeans_random_state
 
-    # Fit the scaler and transform the data
-    scaled_data = scaler.fit_transform(quantitatives)
+    def _reduce(self, df):
+        X = self.scaler_.transform(df[self.columns_])
+        return self.pca_.transform(X) if self.pca_ is not None else X
 
-    # Create a t-SNE object
-    tsne = TSNE(n_components=2, random_state=0)
+    def fit(self, quantitatives):
+        self.columns_ = list(quantitatives.columns)
+        self.scaler_ = StandardScaler().fit(quantitatives)
+        X = self.scaler_.transform(quantitatives)
+        self.pca_ = None
+        if self.pca_components and self.pca_components < X.shape[1]:
+            self.pca_ = PCA(n_components=self.pca_components, random_state=self.random_state).fit(X)
+            X = self.pca_.transform(X)
 
-    # Fit and transform your data
-    tsne_results = tsne.fit_transform(scaled_data)
+        # t-SNE on a random sample only, it has no transform for new points
+        sample = np.arange(len(X))
+        if self.sample_size and self.sample_size < len(X):
+            sample = np.sort(np.random.default_rng(self.random_state).choice(len(X), self.sample_size, replace=False))
+        tsne = TSNE(n_components=2, perplexity=min(self.perplexity, len(sample) - 1), method=self.method,
+                    n_jobs=self.n_jobs, random_state=self.random_state)
+        embedding = tsne.fit_transform(X[sample])
 
-    # Clusters
-    n_clusters = 5 # 5 to start
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    clusters = kmeans.fit_predict(tsne_results)
+        # Other points are placed at the distance weighted mean of their nearest sampled points
+        self.placement_ = KNeighborsRegressor(n_neighbors=min(self.n_neighbors, len(sample)), weights='distance',
+                                              n_jobs=self.n_jobs).fit(X[sample], embedding)
+
+        if self.minibatch:
+            self.kmeans_ = MiniBatchKMeans(n_clusters=self.n_clusters, random_state=self.kmeans_random_state, n_init=3)
+        else:
+            self.kmeans_ = KMeans(n_clusters=self.n_clusters, random_state=self.kmeans_random_state, n_init=10)
+        self.kmeans_.fit(embedding)
+
+        # Results of the fitted rows (sampled rows keep their exact t-SNE coordinates)
+        self.embedding_ = self.placement_.predict(X).astype(embedding.dtype) if len(sample) < len(X) else embedding
+        self.embedding_[sample] = embedding
+        self.labels_ = self.kmeans_.predict(self.embedding_)
+
+        return self
+
+    def transform(self, quantitatives):
+        embedding = self.placement_.predict(self._reduce(quantitatives)).astype(self.kmeans_.cluster_centers_.dtype)
+        return self._results(embedding, self.kmeans_.predict(embedding), quantitatives.index)
+
+    def _results(self, embedding, labels, index):
+        return pd.DataFrame({'tsne_1': embedding[:, 0], 'tsne_2': embedding[:, 1], 'cluster_label': labels}, index=index)
+
+    def fit_transform(self, quantitatives):
+        self.fit(quantitatives)
+        return self._results(self.embedding_, self.labels_, quantitatives.index)
+
+    def save(self, path):
+        dump(self, path)
+
+    @staticmethod
+    def load(path):
+        return load(path)
+
+def cache_path(prefix, df, params, cache_dir='../data/cache'):
+    # Cache file keyed by the data (values, index and columns) and the parameters
+    return os.path.join(cache_dir, f"{prefix}_{frame_hash(df, sorted(params.items()))[:16]}.joblib")
+
+def compute_tsne_clusters(quantitatives, cache_dir='../data/cache', **params):
+    # Embedding and labels cached on disk, keyed by the data and the parameters
+    path = cache_path('tsne', quantitatives, params, cache_dir)
+
+    if os.path.exists(path):
+        return load(path)
+
+    results = ClusterEmbedding(**params).fit_transform(quantitatives)
+    os.makedirs(cache_dir, exist_ok=True)
+    dump(results, path)
+
+    return results
+
+def TSNE_kMeans_figure(quantitatives, results=None, cache_dir='../data/cache', **params):
+    # results: output of compute_tsne_clusters, computed (or read from the cache) when not given
+    if results is None:
+        results = compute_tsne_clusters(quantitatives.drop(columns=['cluster_label'], errors='ignore'), cache_dir, **params)
+    tsne_results = results[['tsne_1', 'tsne_2']].to_numpy()
+    clusters = results['cluster_label'].to_numpy()
+    n_clusters = int(clusters.max()) + 1
 
     # Map the cluster label back to your original DataFrame
     quantitatives['cluster_label'] = clusters
@@ -54,7 +141,7 @@ def TSNE_kMeans_figure(quantitatives):
     # Add cluster features to centroids
     for i, c in enumerate(centroids):
         # Calculate vertical position offset for each feature in the list
-        for j, feature in enumerate(cluster_features[i]):
+        for j, feature in enumerate(cluster_features[i] if i < len(cluster_features) else []):
             offset = j * 3.5
             plt.text(c[0], c[1]-offset, feature, fontsize=10, ha='center', va='center', bbox=dict(facecolor='white', alpha=1.0, edgecolor='black'))
 
@@ -74,37 +161,105 @@ def TSNE_kMeans_figure(quantitatives):
     plt.show()
 
 
-def random_forest_features(quantitatives):
-    # Prepare data for Random Forest Classifier
-    X = quantitatives.drop(columns=['cluster_label'])
-    y = quantitatives['cluster_label']
+# Random forest importances of the features for the cluster labels, kept with the fitted forest
+class FeatureImportance:
+    def __init__(self, n_estimators=100, n_jobs=-1, test_size=0.3, random_state=42, permutation_repeats=5):
+        self.n_estimators = n_estimators
+        self.n_jobs = n_jobs
+        self.test_size = test_size
+        self.random_state = random_state
+        # Permutation importance on the test split (None to skip it)
+        self.permutation_repeats = permutation_repeats
 
-    # split test
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+    def fit(self, quantitatives, target='cluster_label'):
+        X = quantitatives.drop(columns=[target])
+        y = quantitatives[target]
+        self.X_train_, self.X_test_, self.y_train_, self.y_test_ = train_test_split(X, y, test_size=self.test_size, random_state=self.random_state)
 
-    # train model
-    clf = RandomForestClassifier(n_estimators=100, random_state=42)
-    clf.fit(X_train, y_train)
+        # warm_start keeps the trees already grown when n_estimators is raised
+        self.forest_ = RandomForestClassifier(n_estimators=self.n_estimators, random_state=self.random_state, n_jobs=self.n_jobs, warm_start=True)
 
-    # Evaluate test
-    y_pred = clf.predict(X_test)
+        return self.grow(self.n_estimators)
 
-    # Feature importance
-    importances = clf.feature_importances_
-    features = X.columns
-    importance_df = pd.DataFrame({'Feature': features, 'Importance': importances}).sort_values(by='Importance', ascending=False)
+    def grow(self, n_estimators):
+        # Adds trees up to n_estimators, the same forest as a fit with n_estimators from scratch
+        self.n_estimators = n_estimators
+        self.forest_.set_params(n_estimators=n_estimators, n_jobs=self.n_jobs)
+        self.forest_.fit(self.X_train_, self.y_train_)
+
+        return self._evaluate()
+
+    def subset(self, n_estimators):
+        # Copy with the first n_estimators trees, the same forest as a fit with n_estimators from scratch
+        engine = copy.copy(self)
+        engine.n_estimators = n_estimators
+        engine.forest_ = copy.copy(self.forest_)
+        engine.forest_.set_params(n_estimators=n_estimators, n_jobs=self.n_jobs)
+        engine.forest_.estimators_ = self.forest_.estimators_[:n_estimators]
+
+        return engine._evaluate()
+
+    def _evaluate(self):
+        self.y_pred_ = self.forest_.predict(self.X_test_)
+        self.report_ = classification_report(self.y_test_, self.y_pred_)
+
+        self.importances_ = pd.DataFrame({'Feature': self.X_train_.columns, 'Importance': self.forest_.feature_importances_})
+        if self.permutation_repeats:
+            permutation = permutation_importance(self.forest_, self.X_test_, self.y_test_, n_repeats=self.permutation_repeats,
+                                                 random_state=self.random_state, n_jobs=self.n_jobs)
+            self.importances_['Permutation_Importance'] = permutation.importances_mean
+            self.importances_['Permutation_Std'] = permutation.importances_std
+        self.importances_ = self.importances_.sort_values(by='Importance', ascending=False)
+
+        return self
+
+    def save(self, path):
+        dump(self, path)
+
+    @staticmethod
+    def load(path):
+        return load(path)
+
+def compute_feature_importance(quantitatives, cache_dir='../data/cache', n_estimators=100, n_jobs=-1, **params):
+    # Fitted forest cached on disk, keyed by the data and the parameters other than the number of trees and cores
+    path = cache_path('forest', quantitatives, params, cache_dir)
+
+    engine = load(path) if os.path.exists(path) else None
+    if engine is not None:
+        engine.n_jobs = n_jobs
+    if engine is not None and engine.n_estimators == n_estimators:
+        return engine
+    if engine is not None and engine.n_estimators > n_estimators:
+        # Fewer trees: the first ones of the cached forest, which stays on disk
+        return engine.subset(n_estimators)
+
+    if engine is not None:
+        # More trees: only the new ones are trained
+        engine.grow(n_estimators)
+    else:
+        engine = FeatureImportance(n_estimators=n_estimators, n_jobs=n_jobs, **params).fit(quantitatives)
+    os.makedirs(cache_dir, exist_ok=True)
+    dump(engine, path)
+
+    return engine
+
+def random_forest_features(quantitatives, engine=None, cache_dir='../data/cache', **params):
+    # engine: output of compute_feature_importance, computed (or read from the cache) when not given
+    if engine is None:
+        engine = compute_feature_importance(quantitatives, cache_dir, **params)
+    importance_df = engine.importances_
 
     # Visualize
     plt.figure(figsize=(12,8))
 
-    importance_df.set_index('Feature').sort_values(by='Importance').plot(kind='barh', legend=False)
+    # Impurity importance, with the permutation importance on the test split when computed
+    columns = [col for col in ['Importance', 'Permutation_Importance'] if col in importance_df.columns]
+    importance_df.set_index('Feature')[columns].sort_values(by='Importance').plot(kind='barh', legend=len(columns) > 1)
 
     plt.title('Feature Importances from Random Forest')
     plt.xlabel('Importance')
     plt.ylabel('Feature')
     
 
-    print(classification_report(y_test, y_pred))
+    print(engine.report_)
     plt.show()
-
-    
\ No newline at end of file
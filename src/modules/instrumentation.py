@@ -0,0 +1,164 @@
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+# Per-stage instrumentation: wall time, rows in/out, memory delta, as structured events
+# Events go to the 'centris.events' logger (DEBUG), to instrumentation.events and to the added sinks.
+# Without editing the code, from the environment:
+#   CENTRIS_EVENTS=events.jsonl            append every event as a JSON line
+#   CENTRIS_PROFILE=clean_data,model       cProfile of the matching stages, saved to CENTRIS_PROFILE_DIR (default profiles/)
+#   CENTRIS_TRACEMALLOC=feature_engineering traced peak memory of the matching stages
+# A stage matches its own name and every sub-step below it ('clean_data' matches 'clean_data.yard_area'), '*' matches all.
+
+logger = logging.getLogger('centris.events')
+
+def rss_mb():
+    # Resident memory of the process (Linux), None elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+def stage_list(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+def jsonl_sink(path):
+    # Sink appending each event to a JSON lines file
+    def write(event):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+    return write
+
+class StageRecord:
+    # Handle given to the body of a stage, to report the rows it produced and extra fields
+    def __init__(self, name, rows_in):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.extra = {}
+
+    def output(self, df):
+        self.rows_out = len(df)
+        return df
+
+class Instrumentation:
+    def __init__(self, profile=(), trace_memory=(), profile_dir='profiles', max_events=10000):
+        self.profile = set(profile)
+        self.trace_memory = set(trace_memory)
+        self.profile_dir = profile_dir
+        self.max_events = max_events
+        self.enabled = True
+        self.events = []
+        self.sinks = []
+        # Stack of the running stages of each thread, gives the parent of an event
+        self._local = threading.local()
+
+    @classmethod
+    def from_environment(cls):
+        instrumentation = cls(stage_list(os.environ.get('CENTRIS_PROFILE')), stage_list(os.environ.get('CENTRIS_TRACEMALLOC')),
+                              os.environ.get('CENTRIS_PROFILE_DIR', 'profiles'))
+        if os.environ.get('CENTRIS_EVENTS'):
+            instrumentation.add_sink(jsonl_sink(os.environ['CENTRIS_EVENTS']))
+        return instrumentation
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def clear(self):
+        self.events.clear()
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @staticmethod
+    def _matches(name, stages):
+        return '*' in stages or any(name == stage or name.startswith(stage + '.') for stage in stages)
+
+    @contextmanager
+    def stage(self, name, df=None):
+        # with instrumentation.stage('clean_data.yard_area', df) as record: ... record.output(result)
+        record = StageRecord(name, len(df) if df is not None else None)
+        if not self.enabled:
+            yield record
+            return
+
+        # One profiler per profiled subtree: the sub-stages are recorded by the profiler of the outer stage
+        # (a nested cProfile replaces the outer hook, or raises on Python 3.12+)
+        profiler = cProfile.Profile() if self._matches(name, self.profile) and not getattr(self._local, 'profiling', False) else None
+        trace = self._matches(name, self.trace_memory) and not tracemalloc.is_tracing()
+        if trace:
+            tracemalloc.start()
+        rss_before = rss_mb()
+        self._stack.append(name)
+        start = time.perf_counter()
+        if profiler:
+            self._local.profiling = True
+            profiler.enable()
+
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+                self._local.profiling = False
+            seconds = time.perf_counter() - start
+            self._stack.pop()
+            # Steps adding columns in place keep the rows of their input frame
+            if record.rows_out is None and df is not None:
+                record.rows_out = len(df)
+            rss_after = rss_mb()
+
+            event = {
+                'stage': name,
+                'parent': self._stack[-1] if self._stack else None,
+                'seconds': seconds,
+                'rows_in': record.rows_in,
+                'rows_out': record.rows_out,
+                'rows_dropped': record.rows_in - record.rows_out if record.rows_in is not None and record.rows_out is not None else None,
+                'memory_delta_mb': rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+                **record.extra
+            }
+            if trace:
+                event['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+            if profiler:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                event['profile'] = os.path.join(self.profile_dir, f"{name}.{int(time.time() * 1000)}.prof")
+                profiler.dump_stats(event['profile'])
+
+            self.emit(event)
+
+    def emit(self, event):
+        self.events.append(event)
+        del self.events[:-self.max_events]
+        logger.debug('%s', event)
+        for sink in self.sinks:
+            sink(event)
+
+    def instrument(self, name):
+        # Decorator: the first DataFrame argument gives rows_in, a DataFrame result gives rows_out
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                df = next((arg for arg in args if hasattr(arg, 'columns')), None)
+                with self.stage(name, df) as record:
+                    result = function(*args, **kwargs)
+                    if hasattr(result, 'columns'):
+                        record.output(result)
+                return result
+            return wrapper
+        return decorator
+
+instrumentation = Instrumentation.from_environment()
+stage = instrumentation.stage
+instrument = instrumentation.instrument
@@ -1,11 +1,23 @@
+import os
+import time
+from datetime import datetime
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
+from scipy import stats
+from sklearn.base import clone
+from sklearn.linear_model import LinearRegression, Ridge, Lasso
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.model_selection import train_test_split, KFold
 from sklearn.metrics import mean_squared_error, r2_score
 from sklearn.preprocessing import StandardScaler
-from joblib import dump, load
+from joblib import dump, load, Parallel, delayed
+from modules.data_loading import file_hash, frame_hash
+from modules.comps import CompsIndex
+from modules.instrumentation import stage, instrument
+import logging
+
+logger = logging.getLogger(__name__)
 
 def train_linear_regression(X, y):
     regressor = LinearRegression()
@@ -16,29 +28,140 @@ def train_linear_regression(X, y):
 def evaluate_model(model, X, y):
     y_pred = model.predict(X)
     
-    # Compute and print metrics
+    # Compute and log metrics
     mse = mean_squared_error(y, y_pred)
     rmse = np.sqrt(mse)
     r2 = r2_score(y, y_pred)
-    print(f"Mean Squared Error: {mse}")
-    print(f"Root Mean Squared Error: {rmse}")
-    print(f"R^2 Score: {r2}")
+    logger.info("Mean Squared Error: %s", mse)
+    logger.info("Root Mean Squared Error: %s", rmse)
+    logger.info("R^2 Score: %s", r2)
 
     residuals = y - y_pred
 
     return residuals
 
-def feature_selection(X, y, significance_level=0.05):
-    X_with_constant = sm.add_constant(X)
-    
-    regressor_OLS = sm.OLS(y, X_with_constant).fit()
-    
-    print(regressor_OLS.summary())
-    
-    # Drop the constant column and return the selected features
-    return X_with_constant.drop(columns=['const'], errors='ignore')
+# Stepwise selection on the cross products: the inverse of Z'Z (Z = [1, X]) is updated when a column
+# leaves or enters the model instead of refitting the regression at each step
+class StepwiseSelector:
+    def __init__(self, X, y):
+        self.columns = list(X.columns)
+        # Standardized columns for conditioning (p-values do not depend on the scale), constant columns left out
+        values = X.to_numpy(dtype=float)
+        std = values.std(axis=0)
+        self.usable = np.flatnonzero(std > 0)
+        Z = np.column_stack([np.ones(len(values)), (values[:, self.usable] - values[:, self.usable].mean(axis=0)) / std[self.usable]])
+        y = np.asarray(y, dtype=float)
+
+        self.n = len(y)
+        self.gram = Z.T @ Z
+        self.Zy = Z.T @ y
+        self.yy = y @ y
+
+    def fit(self, subset):
+        # subset: positions in the gram matrix (0 is the intercept); returns the inverse, coefficients and RSS
+        inverse = np.linalg.pinv(self.gram[np.ix_(subset, subset)])
+        beta = inverse @ self.Zy[subset]
+        rss = self.yy - beta @ self.Zy[subset]
+
+        return inverse, beta, rss
+
+    def p_values(self, inverse, beta, rss, n_params):
+        if self.n <= n_params:
+            raise ValueError(f"{self.n} rows for {n_params} parameters, no residual degree of freedom for the p-values")
+        sigma2 = max(rss, 0) / (self.n - n_params)
+        t_values = beta / np.sqrt(np.maximum(np.diag(inverse) * sigma2, 1e-300))
+
+        return 2 * stats.t.sf(np.abs(t_values), self.n - n_params)
+
+    def backward(self, significance_level=0.05):
+        subset = [0] + list(range(1, len(self.usable) + 1))
+        inverse, beta, rss = self.fit(subset)
+
+        while len(subset) > 1:
+            p_values = self.p_values(inverse, beta, rss, len(subset))[1:]
+            worst = int(np.argmax(p_values)) + 1
+            if p_values[worst - 1] <= significance_level:
+                break
+
+            # Drop the least significant column: downdate of the inverse and of the coefficients
+            keep = [i for i in range(len(subset)) if i != worst]
+            column = inverse[keep, worst]
+            beta = beta[keep] - column * beta[worst] / inverse[worst, worst]
+            inverse = inverse[np.ix_(keep, keep)] - np.outer(column, column) / inverse[worst, worst]
+            rss = self.yy - beta @ self.Zy[[subset[i] for i in keep]]
+            subset = [subset[i] for i in keep]
+
+        return subset[1:]
+
+    def forward(self, significance_level=0.05):
+        subset = [0]
+        inverse, beta, rss = self.fit(subset)
+        remaining = list(range(1, len(self.usable) + 1))
+
+        # Stops while one residual degree of freedom is left
+        while remaining and len(subset) + 1 < self.n:
+            # Coefficient and p-value of every candidate in the augmented model, all at once (Schur complements)
+            cross = self.gram[np.ix_(subset, remaining)]
+            projected = inverse @ cross
+            schur = self.gram[remaining, remaining] - np.sum(cross * projected, axis=0)
+            valid = schur > 1e-10 * self.n
+            schur = np.where(valid, schur, np.inf)
+            coefficients = (self.Zy[remaining] - cross.T @ beta) / schur
+            new_rss = rss - schur * coefficients ** 2
+            n_params = len(subset) + 1
+            sigma2 = np.maximum(new_rss, 0) / (self.n - n_params)
+            t_values = coefficients / np.sqrt(np.maximum(sigma2 / schur, 1e-300))
+            p_values = np.where(valid, 2 * stats.t.sf(np.abs(t_values), self.n - n_params), 1.0)
+
+            best = int(np.argmin(p_values))
+            if p_values[best] > significance_level:
+                break
+
+            # Add the most significant column: block update of the inverse and of the coefficients
+            u = projected[:, best]
+            inverse = np.block([[inverse + np.outer(u, u) / schur[best], -u[:, None] / schur[best]],
+                                [-u[None, :] / schur[best], np.array([[1 / schur[best]]])]])
+            beta = np.append(beta - u * coefficients[best], coefficients[best])
+            rss = new_rss[best]
+            subset.append(remaining.pop(best))
+
+        return subset[1:]
 
-def main(df):
+    def selected(self, positions):
+        return [self.columns[self.usable[i - 1]] for i in sorted(positions)]
+
+def stepwise_selection(X, y, significance_level=0.05, method='backward'):
+    # Columns of X kept by backward elimination or forward selection on the OLS p-values
+    selector = StepwiseSelector(X, y)
+    if not len(selector.usable):
+        raise ValueError('Every column of X is constant, no feature to select')
+    if method == 'backward' and selector.n <= len(selector.usable) + 1:
+        # The full model has no residual degree of freedom, its p-values are undefined
+        logger.warning("%d rows for %d columns, forward selection instead of backward elimination", selector.n, len(selector.usable))
+        method = 'forward'
+    positions = selector.backward(significance_level) if method == 'backward' else selector.forward(significance_level)
+
+    if not positions:
+        # Keep the most significant column rather than an empty model
+        positions = selector.forward(significance_level=1.0)[:1]
+        logger.warning("No column significant at %s, keeping the best one: %s", significance_level, selector.selected(positions))
+
+    return selector.selected(positions)
+
+@instrument('modeling.feature_selection')
+def feature_selection(X, y, significance_level=0.05, method='backward'):
+    selected = stepwise_selection(X, y, significance_level, method)
+
+    # Summary of the final model only
+    regressor_OLS = sm.OLS(y, sm.add_constant(X[selected], has_constant='add')).fit()
+    logger.info('%s', regressor_OLS.summary())
+
+    # Return the selected features
+    return X[selected]
+
+@instrument('modeling.main')
+def main(df, ids=None):
+    # ids: listing IDs aligned with the rows of df, named after a key column (e.g. df_engineered['ID']), returned by the comps index
 
     X = df.drop('price', axis=1)
     y = df['price']
@@ -48,6 +171,11 @@ def main(df):
 
     # Feature selection
     X_train = feature_selection(X_train, y_train)
+    X = X[X_train.columns]
+    X_test = X_test[X_train.columns]
+
+    # Accumulators of the training rows, update_model folds new sold listings into this model
+    OnlineLinearModel(list(X_train.columns)).partial_fit(X_train.assign(price=y_train)).save('trained_online_stats.joblib')
     
     # Feature scaling
     scaler = StandardScaler()
@@ -71,24 +199,261 @@ def main(df):
     dump(regressor, 'trained_model.joblib')
     dump(scaler, 'trained_scaler.joblib')
 
+    # Comps index over the scaled sold listings, saved with the model artifacts
+    sold = df.assign(**{ids.name: ids.to_numpy()}) if ids is not None else df
+    CompsIndex().fit(sold, scaler).save('trained_comps.joblib')
+
     # Return the original dataframe with appended predictions, residuals and the model
     return df.assign(Predicted_Price=predictions, Residuals=residuals)
 
-def predict_price(listings):
-    # Load the trained model from the file
-    model = load('trained_model.joblib')
-    scaler = load('trained_scaler.joblib')
+# Model selection: candidate regressors compared by K-fold cross-validated RMSE
+candidate_models = {
+    'linear': LinearRegression(),
+    'ridge': Ridge(alpha=1.0),
+    'lasso': Lasso(alpha=100.0, max_iter=10000),
+    'hist_gradient_boosting': HistGradientBoostingRegressor(random_state=42)
+}
 
-    # Select predominant features
-    X = listings[['units', 'income', 'build_eval', 'yard_area', 'mean_price', 'build_age']].copy()
+def fit_fold(name, model, X, y, train_index, test_index, fold):
+    # Scaler fitted on the training fold only
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X.iloc[train_index])
+    X_test = scaler.transform(X.iloc[test_index])
+
+    start = time.perf_counter()
+    model = clone(model).fit(X_train, y.iloc[train_index])
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred = model.predict(X_test)
+    predict_time = time.perf_counter() - start
+
+    return {
+        'model': name,
+        'fold': fold,
+        'rmse': np.sqrt(mean_squared_error(y.iloc[test_index], y_pred)),
+        'r2': r2_score(y.iloc[test_index], y_pred),
+        'fit_time': fit_time,
+        'predict_time': predict_time,
+        'predict_time_per_row': predict_time / len(test_index)
+    }
 
-   # Scaling the new data
-    X_scaled = scaler.transform(X)
+def cross_validate_models(X, y, candidates=None, n_splits=5, n_jobs=-1, random_state=42):
+    # One job per (candidate, fold), run in parallel on every core by default; returns one row per fold
+    candidates = candidates or candidate_models
+    folds = list(KFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X))
 
-    # Predict price with trained model
-    predicted_prices = model.predict(X_scaled)
+    results = Parallel(n_jobs=n_jobs)(delayed(fit_fold)(name, model, X, y, train_index, test_index, fold)
+                                      for name, model in candidates.items()
+                                      for fold, (train_index, test_index) in enumerate(folds))
+
+    return pd.DataFrame(results)
+
+def select_model(df, candidates=None, n_splits=5, n_jobs=-1, artifact_dir='.', random_state=42):
+    X = df.drop('price', axis=1)
+    y = df['price']
+
+    # Per fold scores and timings, then mean per candidate (best RMSE first)
+    cv_results = cross_validate_models(X, y, candidates, n_splits, n_jobs, random_state)
+    summary = cv_results.groupby('model')[['rmse', 'r2', 'fit_time', 'predict_time', 'predict_time_per_row']].mean()
+    summary['rmse_std'] = cv_results.groupby('model')['rmse'].std()
+    summary = summary.sort_values('rmse')
+    logger.info('Cross-validation summary:\n%s', summary.to_string())
+
+    # Refit the best candidate and its scaler on the whole dataset
+    best = summary.index[0]
+    scaler = StandardScaler().fit(X)
+    model = clone((candidates or candidate_models)[best]).fit(scaler.transform(X), y)
+
+    # Single versioned artifact: time of training and hash of the training data
+    version = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{frame_hash(df)[:16]}"
+    artifact = {
+        'version': version,
+        'model_name': best,
+        'model': model,
+        'scaler': scaler,
+        'features': list(X.columns),
+        'cv_results': cv_results,
+        'summary': summary
+    }
+    os.makedirs(artifact_dir, exist_ok=True)
+    path = os.path.join(artifact_dir, f'model_{version}.joblib')
+    dump(artifact, path)
+    logger.info("Selected %s, saved to %s", best, path)
+
+    return artifact, path
+
+# Online training: the scaler and the linear regression are exact functions of running counts, means and
+# centered cross products, so new sold listings are folded in without refitting on the whole history
+class OnlineLinearModel:
+    def __init__(self, features=None):
+        self.features = features
+        self.n = 0
+
+    def partial_fit(self, df):
+        # df holds the new sold listings with their price (an engineered frame or only the features)
+        self.features = self.features or list(predominant_features)
+        X = df[self.features].to_numpy(dtype=float)
+        y = df['price'].to_numpy(dtype=float)
+        if not len(X):
+            return self
+
+        # Centered statistics of the batch, merged with the accumulated ones (pairwise update, O(p^2) per row)
+        n_batch = len(X)
+        mean_x, mean_y = X.mean(axis=0), y.mean()
+        Xc, yc = X - mean_x, y - mean_y
+        cov_xx, cov_xy, cov_yy = Xc.T @ Xc, Xc.T @ yc, yc @ yc
+
+        if self.n == 0:
+            self.n, self.mean_x, self.mean_y = n_batch, mean_x, mean_y
+            self.cov_xx, self.cov_xy, self.cov_yy = cov_xx, cov_xy, cov_yy
+        else:
+            n = self.n + n_batch
+            delta_x, delta_y = mean_x - self.mean_x, mean_y - self.mean_y
+            weight = self.n * n_batch / n
+            self.cov_xx = self.cov_xx + cov_xx + weight * np.outer(delta_x, delta_x)
+            self.cov_xy = self.cov_xy + cov_xy + weight * delta_x * delta_y
+            self.cov_yy = self.cov_yy + cov_yy + weight * delta_y ** 2
+            self.mean_x = self.mean_x + delta_x * n_batch / n
+            self.mean_y = self.mean_y + delta_y * n_batch / n
+            self.n = n
+
+        return self
+
+    @property
+    def scaler(self):
+        # Same attributes as a StandardScaler fitted on every row seen
+        var = np.diag(self.cov_xx) / self.n
+        scaler = StandardScaler()
+        scaler.mean_, scaler.var_ = self.mean_x.copy(), var
+        scaler.scale_ = np.where(var > 0, np.sqrt(var), 1.0)
+        scaler.n_samples_seen_ = self.n
+        scaler.n_features_in_ = len(self.features)
+        scaler.feature_names_in_ = np.array(self.features, dtype=object)
+        return scaler
+
+    @property
+    def model(self):
+        # Same coefficients as a LinearRegression fitted on the scaled rows
+        scale = self.scaler.scale_
+        coef = np.linalg.lstsq(self.cov_xx, self.cov_xy, rcond=None)[0] * scale
+        model = LinearRegression()
+        model.coef_, model.intercept_ = coef, self.mean_y
+        model.n_features_in_ = len(self.features)
+        return model
+
+    def matches_refit(self, df, rtol=1e-6):
+        # Check against a full refit of the scaler and the regression on df (every row folded in so far)
+        X, y = df[self.features], df['price']
+        scaler = StandardScaler().fit(X)
+        model = LinearRegression().fit(scaler.transform(X), y)
+        online_predictions = self.model.predict(self.scaler.transform(X))
+
+        return (np.allclose(self.scaler.mean_, scaler.mean_, rtol=rtol) and np.allclose(self.scaler.scale_, scaler.scale_, rtol=rtol) and
+                np.allclose(online_predictions, model.predict(scaler.transform(X)), rtol=rtol))
+
+    def save(self, path='trained_online_stats.joblib'):
+        dump(self, path)
+
+    @staticmethod
+    def load(path='trained_online_stats.joblib'):
+        return load(path)
+
+def update_model(new_listings, stats_path='trained_online_stats.joblib', model_path='trained_model.joblib', scaler_path='trained_scaler.joblib'):
+    # Fold the new sold listings into the accumulators saved by main, then rewrite the artifacts read by predict_price
+    if not os.path.exists(stats_path):
+        raise FileNotFoundError(f"No online statistics at {stats_path}, train the model with main() first")
+    online = OnlineLinearModel.load(stats_path)
+    online.partial_fit(new_listings)
+
+    online.save(stats_path)
+    dump(online.model, model_path)
+    dump(online.scaler, scaler_path)
+
+    return online
+
+# Features used by the trained model
+predominant_features = ['units', 'income', 'build_eval', 'yard_area', 'mean_price', 'build_age']
+
+# In-process cache of the trained model and scaler, reloaded only when an artifact changes on disk
+class ModelRegistry:
+    def __init__(self, model_path='trained_model.joblib', scaler_path='trained_scaler.joblib', mmap_mode=None, verify_hash=False,
+                 comps_path='trained_comps.joblib', artifact_path=None):
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.comps_path = comps_path
+        # Versioned artifact from select_model (model and scaler in one file), replaces model_path and scaler_path
+        self.artifact_path = artifact_path
+        self.mmap_mode = mmap_mode
+        # Also compare the content hash (for copies that keep the same mtime)
+        self.verify_hash = verify_hash
+        self._cache = {}
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size, file_hash(path) if self.verify_hash else None)
+
+        cached = self._cache.get(path)
+        if cached is None or cached[0] != version:
+            with stage('model.load') as record:
+                record.extra['path'] = path
+                cached = (version, load(path, mmap_mode=self.mmap_mode))
+            self._cache[path] = cached
+
+        return cached[1]
+
+    @property
+    def model(self):
+        if self.artifact_path:
+            return self.get(self.artifact_path)['model']
+        return self.get(self.model_path)
+
+    @property
+    def scaler(self):
+        if self.artifact_path:
+            return self.get(self.artifact_path)['scaler']
+        return self.get(self.scaler_path)
+
+    @property
+    def comps(self):
+        return self.get(self.comps_path)
+
+    def clear(self):
+        self._cache.clear()
+
+    def predict(self, X):
+        # X is a DataFrame with the features of the scaler (the predominant features) or an array with the same column order
+        scaler = self.scaler
+        if isinstance(X, pd.DataFrame):
+            X = X[list(scaler.feature_names_in_) if hasattr(scaler, 'feature_names_in_') else predominant_features]
+        elif hasattr(scaler, 'feature_names_in_'):
+            X = pd.DataFrame(np.asarray(X, dtype=float).reshape(-1, len(scaler.feature_names_in_)), columns=scaler.feature_names_in_)
+
+        # Scaling the new data then predict price with trained model
+        model = self.model
+        with stage('model.predict', X) as record:
+            record.rows_out = len(X)
+            return model.predict(scaler.transform(X))
+
+model_registry = ModelRegistry()
+
+def predict_price(listings, registry=None):
+    # Trained model and scaler come from the in-process cache
+    registry = registry or model_registry
+
+    # Predict price from the predominant features
+    with stage('predict_price', listings) as record:
+        predicted_prices = registry.predict(listings)
+        record.rows_out = len(predicted_prices)
 
     # Caluclate residuals
     residuals = listings['price'] - predicted_prices
 
-    return listings.assign(Predicted_Price=predicted_prices, Residuals=residuals)
\ No newline at end of file
+    return listings.assign(Predicted_Price=predicted_prices, Residuals=residuals)
+
+def find_comps(listings, k=5, registry=None):
+    # k most similar sold listings for every row, from the comps index saved by main
+    registry = registry or model_registry
+
+    return registry.comps.transform(listings, k)
@@ -0,0 +1,92 @@
+import os
+import hashlib
+import logging
+import joblib
+import pandas as pd
+from modules.data_loading import load_listings_chunks, key_columns, file_hash
+from modules.data_preprocessing import clean_data
+from modules.modeling import predict_price, model_registry
+
+logger = logging.getLogger(__name__)
+
+# Streaming mode: CSV -> clean -> engineer -> predict, one chunk at a time
+def stream_predictions(feature_pipeline, input_path='../data/listings.csv', output_path='../output/prediction_listings.csv',
+                       chunksize=10000):
+    # feature_pipeline is a FeaturePipeline fitted on the training listings, district stats never come from a chunk
+    rows_written = 0
+
+    for chunk in load_listings_chunks(chunksize, input_path):
+        list_cleaned = clean_data(chunk)
+        if list_cleaned.empty:
+            continue
+
+        list_engineered = feature_pipeline.transform(list_cleaned)
+        results = predict_price(list_engineered)
+
+        # Append to the prediction file, header only once
+        results.to_csv(output_path, mode='w' if rows_written == 0 else 'a', header=rows_written == 0, index=False)
+        rows_written += len(results)
+
+    return rows_written
+
+
+# Incremental mode: only listings that are new or changed since the last run are cleaned, engineered and scored
+def row_hashes(df):
+    # Content hash of each raw row, independent of the column order
+    return pd.util.hash_pandas_object(df[sorted(df.columns)].astype(str), index=False).to_numpy()
+
+def scoring_version(feature_pipeline, registry=None):
+    # Fitted feature pipeline (district stats, services) and model artifacts the stored predictions come from
+    registry = registry or model_registry
+    paths = [registry.artifact_path] if registry.artifact_path else [registry.model_path, registry.scaler_path]
+    parts = [joblib.hash(feature_pipeline)] + [file_hash(path) for path in paths]
+
+    return hashlib.sha256(':'.join(parts).encode()).hexdigest()[:16]
+
+def incremental_predictions(feature_pipeline, input_path='../data/listings.csv', output_path='../output/prediction_listings.csv',
+                            store_path='../data/cache/feature_store.feather', key=None, registry=None):
+    listings = pd.read_csv(input_path, index_col=None)
+    key = key or next(col for col in key_columns if col in listings.columns)
+    listings['_row_hash'] = row_hashes(listings)
+
+    # Feature store: scored listings plus the hash of every processed row (dropped ones included)
+    index_path = store_path.replace('.feather', '_index.feather')
+    version_path = store_path.replace('.feather', '_version.txt')
+    version = scoring_version(feature_pipeline, registry)
+    stored_version = None
+    if os.path.exists(version_path):
+        with open(version_path) as f:
+            stored_version = f.read().strip()
+
+    if stored_version not in (None, version):
+        # A retrained model or a refitted pipeline invalidates every stored prediction
+        logger.warning("Model or feature pipeline changed since the last run, re-scoring every listing")
+    if stored_version == version and os.path.exists(store_path) and os.path.exists(index_path):
+        store = pd.read_feather(store_path)
+        seen = pd.read_feather(index_path)
+    else:
+        store = pd.DataFrame(columns=[key])
+        seen = pd.DataFrame({key: pd.Series(dtype=listings[key].dtype), '_row_hash': pd.Series(dtype='uint64')})
+
+    # New keys or known keys whose content changed
+    known = listings[[key, '_row_hash']].merge(seen, on=[key, '_row_hash'], how='left', indicator=True)['_merge'] == 'both'
+    delta = listings[~known.to_numpy()]
+
+    if not delta.empty:
+        list_cleaned = clean_data(delta.drop(columns='_row_hash'))
+        results = predict_price(feature_pipeline.transform(list_cleaned), registry) if not list_cleaned.empty else list_cleaned
+
+        # Replace the previous version of the changed listings
+        kept = store[~store[key].isin(delta[key])]
+        store = pd.concat([kept, results], ignore_index=True) if not kept.empty else results.reset_index(drop=True)
+        seen = pd.concat([seen[~seen[key].isin(delta[key])], delta[[key, '_row_hash']]], ignore_index=True)
+
+        os.makedirs(os.path.dirname(store_path) or '.', exist_ok=True)
+        store.to_feather(store_path)
+        seen.to_feather(index_path)
+        with open(version_path, 'w') as f:
+            f.write(version)
+
+    store.to_csv(output_path, index=False)
+
+    return len(delta)
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+from joblib import dump, load, Parallel, delayed
+from modules.data_loading import key_columns
+
+# Broker text fields (names after clean_data) matched against the investor description
+text_columns = ['remarks', 'addenda', 'inclusions', 'renovations']
+
+# Common French words that carry no meaning for the matching
+french_stop_words = ['a', 'à', 'au', 'aux', 'avec', 'ce', 'ces', 'cette', 'dans', 'de', 'des', 'du', 'elle', 'en', 'est', 'et', 'il',
+                     'ils', 'la', 'le', 'les', 'leur', 'mais', 'ne', 'nous', 'on', 'ou', 'où', 'par', 'pas', 'pour', 'qu', 'que', 'qui',
+                     'sa', 'se', 'ses', 'son', 'sont', 'sur', 'un', 'une', 'vous', 'votre', 'vos', 'y', 'd', 'l', 'c', 's', 'n', 'j', 'm', 't']
+
+# Lower case, accents removed once for the whole column (the vectorizer does it per document otherwise)
+def normalize_text(texts):
+    return texts.str.lower().str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+
+# Sparse TF-IDF index over the broker text, built incrementally and queried with sparse products
+class ListingIndex:
+    def __init__(self, n_features=2 ** 20, ngram_range=(1, 1), key=None, n_jobs=None):
+        self.key = key
+        self.n_jobs = n_jobs
+        # Hashing keeps the vocabulary stateless, so new listings can be added without refitting
+        self.vectorizer = HashingVectorizer(n_features=n_features, ngram_range=ngram_range, alternate_sign=False, norm=None,
+                                            lowercase=False, stop_words=normalize_text(pd.Series(french_stop_words)).tolist())
+        self.term_counts = []
+        self.doc_freq = np.zeros(n_features, dtype=np.int64)
+        self.listings = pd.DataFrame()
+        self.active = np.zeros(0, dtype=bool)
+        self._weights = None
+
+    def _term_counts(self, texts, chunksize=5000):
+        # Stateless vectorizer, large batches are hashed in parallel chunks
+        texts = normalize_text(pd.Series(texts, dtype=str)).tolist()
+        if self.n_jobs in (None, 1) or len(texts) <= chunksize:
+            counts = self.vectorizer.transform(texts).tocsr()
+        else:
+            chunks = Parallel(n_jobs=self.n_jobs)(delayed(self.vectorizer.transform)(texts[start:start + chunksize])
+                                                  for start in range(0, len(texts), chunksize))
+            counts = vstack(chunks, format='csr')
+        counts.data = 1 + np.log(counts.data)  # sublinear tf
+        return counts
+
+    def add(self, df):
+        # df is a cleaned or engineered frame, listings already in the index are replaced
+        self.key = self.key or next(col for col in key_columns if col in df.columns)
+        text = df.reindex(columns=text_columns).fillna('').astype(str)
+        texts = text[text_columns[0]]
+        for col in text_columns[1:]:
+            texts = texts + ' ' + text[col]
+        counts = self._term_counts(texts.tolist())
+
+        # Retire the previous version of re-added listings
+        if len(self.listings):
+            replaced = self.listings[self.key].isin(df[self.key]).to_numpy() & self.active
+            if replaced.any():
+                self.doc_freq -= np.asarray((self.matrix[np.flatnonzero(replaced)] > 0).sum(axis=0)).ravel()
+                self.active[replaced] = False
+
+        self.term_counts.append(counts)
+        self.doc_freq += np.asarray((counts > 0).sum(axis=0)).ravel()
+        # Key and numeric columns, used by the filters and returned with the results
+        listings = df[[self.key] + [col for col in df.select_dtypes('number').columns if col != self.key]]
+        self.listings = pd.concat([self.listings, listings], ignore_index=True) if len(self.listings) else listings.reset_index(drop=True)
+        self.active = np.concatenate([self.active, np.ones(len(df), dtype=bool)])
+        self._weights = None
+
+        return self
+
+    @property
+    def matrix(self):
+        if len(self.term_counts) > 1:
+            self.term_counts = [vstack(self.term_counts, format='csr')]
+        return self.term_counts[0]
+
+    def _idf(self):
+        n_docs = self.active.sum()
+        return np.log((1 + n_docs) / (1 + self.doc_freq)) + 1
+
+    def weights(self):
+        # Row normalized TF-IDF, stored by column so a query only touches the postings of its terms
+        if self._weights is None:
+            self._idf_weights = self._idf()
+            weighted = self.matrix.copy()
+            weighted.data = weighted.data * self._idf_weights[weighted.indices]
+            rows = np.repeat(np.arange(weighted.shape[0]), np.diff(weighted.indptr))
+            norms = np.sqrt(np.bincount(rows, weights=weighted.data ** 2, minlength=weighted.shape[0]))
+            weighted.data = weighted.data / norms[rows]
+            self._weights = weighted.tocsc()
+        return self._weights
+
+    def query(self, text, k=10, filters=None):
+        # filters: {column: (min, max)}, None for an open bound, on the engineered numeric columns
+        weights = self.weights()
+        query = self._term_counts([text])
+        query.data = query.data * self._idf_weights[query.indices]
+        norm = np.sqrt((query.data ** 2).sum())
+        if norm == 0:
+            return self.listings.iloc[:0].assign(score=[])
+
+        # Cosine similarity: sparse matrix-vector product restricted to the query terms
+        scores = weights[:, query.indices] @ (query.data / norm)
+
+        # Only listings sharing at least one term with the query
+        mask = self.active & (scores > 0)
+        for col, (low, high) in (filters or {}).items():
+            values = self.listings[col].to_numpy()
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        scores = np.where(mask, scores, -np.inf)
+
+        k = min(k, int(mask.sum()))
+        top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=int)
+        top = top[np.argsort(-scores[top])]
+
+        return self.listings.iloc[top].assign(score=scores[top])
+
+    def __getstate__(self):
+        # The weighted matrix is derived, it is rebuilt on the first query after loading
+        state = self.__dict__.copy()
+        state['term_counts'] = [self.matrix] if self.term_counts else []
+        state['_weights'] = None
+        state.pop('_idf_weights', None)
+        return state
+
+    def save(self, path='listing_index.joblib'):
+        dump(self, path)
+
+    @staticmethod
+    def load(path='listing_index.joblib'):
+        return load(path)
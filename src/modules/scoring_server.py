@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import json
+import re
+import time
+from collections import Counter, deque
+import numpy as np
+import pandas as pd
+from modules.data_preprocessing import clean_data, FeaturePipeline
+from modules.modeling import predict_price, model_registry
+
+# Local HTTP scoring service: raw Centris listings (JSON) -> clean -> engineer -> cached model
+# Run from src/: python -m modules.scoring_server --port 8000
+# POST /predict with a listing, a list of listings or {"listings": [...]}, GET /metrics, GET /health
+
+# Raw Centris columns expected by clean_data, missing keys are treated as empty fields
+listing_columns = ['Prix', 'District', 'Un. rés.', 'Rev. brut. pot.', 'YearBuilt', 'Type de bâtiment', 'Dimensions du bâtiment',
+                   'Éval. terrain', 'Superficie habitable', 'Éval. bâtiment', 'Dimensions du terrain', 'Cert. de localisation',
+                   'Superficie du terrain', "Plan d'eau", 'Piscine', 'Stationnement (total)', 'Chauffage', 'Eau (accès)',
+                   'Foyers-Poêles', 'Équip./Serv.', 'Rénovations', 'Inclusions', 'Exclusions', 'Remarques - Courtier', 'Addenda',
+                   'Nbre pièces', 'Nbre chambres (hors-sol + sous-sol)', "Nbre salles de bains + salles d'eau"]
+
+# Fields parsed as numbers by clean_data, checked (and converted) before a listing joins a batch
+money_columns = ['Prix', 'Rev. brut. pot.', 'Éval. terrain', 'Éval. bâtiment']
+number_columns = ['Un. rés.', 'Nbre pièces', 'Nbre chambres (hors-sol + sous-sol)', 'lat', 'lon']
+washrooms_column = "Nbre salles de bains + salles d'eau"
+
+def validate_listing(record):
+    # Raises ValueError on a value clean_data cannot parse, so a bad listing is rejected alone instead of failing its batch
+    listing = {}
+    for key, value in record.items():
+        if isinstance(value, str) and not value.strip():
+            value = None
+        if value is None:
+            listing[key] = None
+        elif isinstance(value, (bool, list, dict)):
+            raise ValueError(f"{key}: expected a number or a text, got {json.dumps(value)}")
+        elif key in money_columns:
+            # "840 000 $", 840000 or "840 000 $ + TPS/TVQ"
+            amount = re.sub(r'[\$, ]', '', str(int(value)) if isinstance(value, (int, float)) else value).split('+')[0]
+            if not amount.isdigit():
+                raise ValueError(f"{key}: expected an amount like '840 000 $', got {json.dumps(value, ensure_ascii=False)}")
+            listing[key] = str(int(value)) if isinstance(value, (int, float)) else value
+        elif key in number_columns:
+            try:
+                listing[key] = float(value)
+            except ValueError:
+                raise ValueError(f"{key}: expected a number, got {json.dumps(value, ensure_ascii=False)}") from None
+        elif key == washrooms_column:
+            # "1+0"
+            text = str(int(value)) if isinstance(value, (int, float)) else value
+            if not re.fullmatch(r'\s*\d+(\s*\+\s*\d+)*\s*', text):
+                raise ValueError(f"{key}: expected a count like '1+0', got {json.dumps(value, ensure_ascii=False)}")
+            listing[key] = text.replace(' ', '')
+        else:
+            listing[key] = str(value) if isinstance(value, (int, float)) else value
+
+    # The number of units is a feature of the model, missing it cannot be predicted
+    if listing.get('Un. rés.') is None or np.isnan(listing['Un. rés.']):
+        raise ValueError("Un. rés.: the number of units is required")
+
+    return listing
+
+def score_listings(listings, feature_pipeline, registry=None):
+    # One result row per input listing, NaN when the listing is dropped by clean_data
+    df = listings.reset_index(drop=True)
+    df = df.reindex(columns=list(dict.fromkeys(listing_columns + list(df.columns))))
+    df['_row'] = np.arange(len(df))
+
+    results = pd.DataFrame(np.nan, index=range(len(df)), columns=['Predicted_Price', 'Residuals'])
+    df_cleaned = clean_data(df)
+    if not df_cleaned.empty:
+        scored = predict_price(feature_pipeline.transform(df_cleaned), registry)
+        results.loc[scored['_row'].to_numpy()] = scored[['Predicted_Price', 'Residuals']].to_numpy()
+
+    return results
+
+class ScoringMetrics:
+    def __init__(self, history=10000):
+        self.requests = 0
+        self.listings = 0
+        self.batches = 0
+        self.errors = 0
+        self.rejected = 0
+        self.batch_sizes = Counter()
+        self.latencies = deque(maxlen=history)
+
+    def record_batch(self, size):
+        self.batches += 1
+        self.batch_sizes[size] += 1
+
+    def record_request(self, size, latency):
+        self.requests += 1
+        self.listings += size
+        self.latencies.append(latency)
+
+    def snapshot(self):
+        latencies = np.array(self.latencies) * 1000
+        return {
+            'requests': self.requests,
+            'listings': self.listings,
+            'batches': self.batches,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'mean_batch_size': self.listings / self.batches if self.batches else 0,
+            'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            'latency_ms': {
+                'p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                'p95': float(np.percentile(latencies, 95)) if len(latencies) else None,
+                'max': float(latencies.max()) if len(latencies) else None
+            }
+        }
+
+# Coalesces concurrent requests into one scoring call per time window
+class MicroBatcher:
+    def __init__(self, score_batch, batch_window=0.01, max_batch_size=256, metrics=None):
+        self.score_batch = score_batch
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.metrics = metrics or ScoringMetrics()
+        self.queue = asyncio.Queue()
+
+    async def submit(self, records):
+        # Returns (result rows, size of the batch they were scored in)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((records, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.batch_window
+
+            # Keep collecting until the window closes or the batch is full
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            await self.score(batch, size)
+
+    async def _score_records(self, records):
+        # Scoring is CPU bound, keep the event loop free to accept requests
+        results = await asyncio.get_running_loop().run_in_executor(None, self.score_batch, pd.DataFrame(records))
+        return results.astype(object).where(results.notna(), None)
+
+    async def score(self, batch, size):
+        records = [record for request_records, _ in batch for record in request_records]
+        self.metrics.record_batch(size)
+
+        try:
+            results = await self._score_records(records)
+        except Exception:
+            # A malformed listing must not fail the other requests of the batch: each request is scored on its own
+            for request_records, future in batch:
+                try:
+                    rows = (await self._score_records(request_records)).to_dict(orient='records')
+                except Exception as e:
+                    self.metrics.errors += 1
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                if not future.done():
+                    future.set_result((rows, size))
+            return
+
+        start = 0
+        for request_records, future in batch:
+            rows = results.iloc[start:start + len(request_records)].to_dict(orient='records')
+            start += len(request_records)
+            if not future.done():
+                future.set_result((rows, size))
+
+class ScoringServer:
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+    def __init__(self, feature_pipeline, registry=None, batch_window=0.01, max_batch_size=256):
+        self.metrics = ScoringMetrics()
+        self.batcher = MicroBatcher(lambda df: score_listings(df, feature_pipeline, registry or model_registry),
+                                    batch_window, max_batch_size, self.metrics)
+
+    async def start(self, host='127.0.0.1', port=8000):
+        self.batcher_task = asyncio.create_task(self.batcher.run())
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.batcher_task.cancel()
+
+    async def route(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        if method == 'GET' and path == '/metrics':
+            return 200, self.metrics.snapshot()
+        if method != 'POST' or path != '/predict':
+            return 404, {'error': f'{method} {path} not found'}
+
+        try:
+            payload = json.loads(body or b'null')
+            records = payload['listings'] if isinstance(payload, dict) and 'listings' in payload else payload
+            records = [records] if isinstance(records, dict) else records
+            if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+                raise ValueError('expected a listing, a list of listings or {"listings": [...]}')
+            records = [validate_listing(record) for record in records]
+        except (ValueError, KeyError) as e:
+            self.metrics.rejected += 1
+            return 400, {'error': str(e)}
+
+        start = time.perf_counter()
+        try:
+            predictions, batch_size = await self.batcher.submit(records) if records else ([], 0)
+        except (ValueError, KeyError) as e:
+            # Listing values clean_data could not parse: a client error
+            self.metrics.rejected += 1
+            return 400, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': str(e)}
+        latency = time.perf_counter() - start
+        self.metrics.record_request(len(records), latency)
+
+        return 200, {'predictions': predictions, 'latency_ms': latency * 1000, 'batch_size': batch_size}
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            status, payload = await self.route(method, path.split('?')[0], body)
+        except (ValueError, asyncio.IncompleteReadError) as e:
+            status, payload = 400, {'error': str(e)}
+
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write((f'HTTP/1.1 {status} {self.reasons[status]}\r\n'
+                      f'Content-Type: application/json; charset=utf-8\r\n'
+                      f'Content-Length: {len(data)}\r\n'
+                      f'Connection: close\r\n\r\n').encode('latin-1') + data)
+        await writer.drain()
+        writer.close()
+
+async def serve(feature_pipeline, host='127.0.0.1', port=8000, batch_window=0.01, max_batch_size=256):
+    server = await ScoringServer(feature_pipeline, batch_window=batch_window, max_batch_size=max_batch_size).start(host, port)
+    print(f"Scoring server listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--pipeline', default='trained_pipeline.joblib')
+    parser.add_argument('--batch-window', type=float, default=0.01, help='seconds to wait for more requests')
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    asyncio.run(serve(FeaturePipeline.load(args.pipeline), args.host, args.port, args.batch_window, args.max_batch_size))
@@ -0,0 +1,26 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+# Tests import the modules as the notebook does (from src/), wherever pytest is run from
+src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, src_dir)
+# The scraper scripts of input/ are imported as top level modules, as they are run
+input_dir = os.path.join(src_dir, '..', 'input')
+sys.path.insert(0, input_dir)
+train_path = os.path.join(src_dir, '..', 'data', 'train.csv')
+
+@pytest.fixture(scope='session')
+def train():
+    return pd.read_csv(train_path, index_col=None)
+
+@pytest.fixture(scope='session')
+def cleaned(train):
+    from modules.data_preprocessing import clean_data
+    return clean_data(train)
+
+@pytest.fixture(scope='session')
+def engineered(cleaned):
+    from modules.data_preprocessing import feature_engineering
+    return feature_engineering(cleaned)
@@ -1 +1,87 @@
-# to come
\ No newline at end of file
+import numpy as np
+import pandas as pd
+import pytest
+from modules.data_preprocessing import clean_data, feature_engineering, NeighbourhoodPrices
+from benchmarks.reference_clean_data import clean_data_rowwise
+
+# Vectorized parsers against the row-wise clean_data they replaced
+def test_clean_data_matches_rowwise_reference(train, cleaned):
+    pd.testing.assert_frame_equal(cleaned, clean_data_rowwise(train))
+
+def test_clean_data_matches_rowwise_reference_on_malformed_fields(train):
+    # Fields with missing or partial values, the paths of the parsers that fall back to the dimensions or to defaults
+    df = train.head(200).copy()
+    df.loc[::3, 'Superficie habitable'] = None
+    df.loc[::4, 'Superficie du terrain'] = None
+    df.loc[::5, 'Dimensions du terrain'] = '25 p'
+    df.loc[::6, 'Cert. de localisation'] = 'Oui'
+    df.loc[::7, "Plan d'eau"] = 'None'
+    df.loc[::8, 'Stationnement (total)'] = None
+    pd.testing.assert_frame_equal(clean_data(df), clean_data_rowwise(df))
+
+# Parallel partitions against the serial path
+def test_clean_data_parallel_matches_serial(train, cleaned):
+    pd.testing.assert_frame_equal(clean_data(train, workers=2), cleaned)
+    pd.testing.assert_frame_equal(clean_data(train, compact=True, workers=3), clean_data(train, compact=True))
+
+def test_feature_engineering_parallel_matches_serial(cleaned, engineered):
+    pd.testing.assert_frame_equal(feature_engineering(cleaned, workers=2), engineered)
+    pd.testing.assert_frame_equal(feature_engineering(cleaned, compact=True, workers=3), feature_engineering(cleaned, compact=True))
+
+def test_parallel_with_more_workers_than_rows(train):
+    df = train.head(5)
+    pd.testing.assert_frame_equal(clean_data(df, workers=8), clean_data(df))
+
+# Neighbourhood prices against a brute-force haversine scan
+def haversine_km(lat, lon, lat_sold, lon_sold):
+    lat, lon, lat_sold, lon_sold = map(np.radians, (lat[:, None], lon[:, None], lat_sold[None, :], lon_sold[None, :]))
+    a = np.sin((lat_sold - lat) / 2) ** 2 + np.cos(lat) * np.cos(lat_sold) * np.sin((lon_sold - lon) / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(a))
+
+def brute_force_neighbourhood(listings, sold, radius_km, n_neighbors, key=None):
+    sold = sold[sold['lat'].notna() & sold['lon'].notna()]
+    distances = haversine_km(listings['lat'].to_numpy(), listings['lon'].to_numpy(), sold['lat'].to_numpy(), sold['lon'].to_numpy())
+    if key:
+        # A sold listing is not its own neighbour
+        distances[listings[key].to_numpy()[:, None] == sold[key].to_numpy()[None, :]] = np.inf
+    prices = sold['price'].to_numpy(dtype=float)
+
+    rows = []
+    for row in distances:
+        if np.isnan(row).all():
+            rows.append([np.nan, np.nan, np.nan, 0, np.nan])
+            continue
+        nearest = np.argsort(row)[:n_neighbors]
+        nearest = nearest[np.isfinite(row[nearest])]
+        within = row <= radius_km
+        rows.append([prices[nearest].mean(), np.median(prices[nearest]), row[nearest].mean(), within.sum(),
+                     prices[within].mean() if within.any() else np.nan])
+
+    return pd.DataFrame(rows, index=listings.index, columns=['knn_mean_price', 'knn_median_price', 'knn_distance_km', 'radius_count',
+                                                             'radius_mean_price'])
+
+@pytest.fixture(scope='module')
+def located(cleaned):
+    # Coordinates spread over a few km around Montréal, some listings without them
+    rng = np.random.default_rng(0)
+    df = cleaned.assign(lat=rng.normal(45.55, 0.02, len(cleaned)), lon=rng.normal(-73.62, 0.03, len(cleaned)))
+    df.loc[df.index[::17], 'lat'] = np.nan
+    df.loc[df.index[::23], 'lon'] = np.nan
+    return df
+
+def test_neighbourhood_prices_excludes_the_listing_itself(located):
+    neighbourhood = NeighbourhoodPrices(radius_km=1.0, n_neighbors=5).fit(located)
+    expected = brute_force_neighbourhood(located, located, 1.0, 5, key='ID')
+    pd.testing.assert_frame_equal(neighbourhood.transform(located), expected, check_dtype=False, rtol=1e-6)
+    assert (expected['radius_count'] > 0).mean() > 0.5
+
+def test_neighbourhood_prices_of_new_listings(located):
+    sold, listings = located.iloc[:1200], located.iloc[1200:].drop(columns='ID')
+    neighbourhood = NeighbourhoodPrices(radius_km=0.5, n_neighbors=10).fit(sold)
+    features = neighbourhood.transform(listings)
+    pd.testing.assert_frame_equal(features, brute_force_neighbourhood(listings, sold, 0.5, 10), check_dtype=False, rtol=1e-6)
+
+    # Listings without coordinates get no neighbourhood
+    missing = listings['lat'].isna() | listings['lon'].isna()
+    assert missing.any() and features.loc[missing, 'knn_mean_price'].isna().all()
+    assert (features.loc[missing, 'radius_count'] == 0).all()
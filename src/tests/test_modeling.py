@@ -1 +1,105 @@
-# to come
\ No newline at end of file
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+from joblib import load
+from sklearn.model_selection import train_test_split
+from modules.modeling import (StepwiseSelector, stepwise_selection, feature_selection, main, OnlineLinearModel, update_model,
+                              predominant_features)
+
+# Numeric engineered columns without exact collinearity (year_built and build_age are the same information)
+candidate_features = ['units', 'income', 'build_eval', 'land_eval', 'yard_area', 'living_area', 'rooms', 'bedrooms', 'washrooms',
+                      'total_parking', 'mean_price', 'build_age']
+
+def ols_p_values(X, y, columns):
+    return sm.OLS(y, sm.add_constant(X[columns], has_constant='add')).fit().pvalues.drop('const')
+
+def refit_backward(X, y, significance_level):
+    # Backward elimination refitting the statsmodels OLS at every step
+    columns = list(X.columns)
+    while columns:
+        p_values = ols_p_values(X, y, columns)
+        if p_values.max() <= significance_level:
+            break
+        columns.remove(p_values.idxmax())
+    return columns
+
+def refit_forward(X, y, significance_level):
+    columns, remaining = [], list(X.columns)
+    while remaining:
+        p_values = pd.Series({col: ols_p_values(X, y, columns + [col])[col] for col in remaining})
+        if p_values.min() > significance_level:
+            break
+        columns.append(p_values.idxmin())
+        remaining.remove(p_values.idxmin())
+    return columns
+
+@pytest.mark.parametrize('significance_level', [0.05, 0.01])
+def test_backward_matches_statsmodels_refits(engineered, significance_level):
+    X, y = engineered[candidate_features], engineered['price']
+    expected = refit_backward(X, y, significance_level)
+    assert stepwise_selection(X, y, significance_level) == [col for col in X.columns if col in expected]
+
+@pytest.mark.parametrize('significance_level', [0.05, 0.01])
+def test_forward_matches_statsmodels_refits(engineered, significance_level):
+    X, y = engineered[candidate_features], engineered['price']
+    expected = refit_forward(X, y, significance_level)
+    assert stepwise_selection(X, y, significance_level, method='forward') == [col for col in X.columns if col in expected]
+
+def test_p_values_match_statsmodels(engineered):
+    X, y = engineered[candidate_features], engineered['price']
+    selector = StepwiseSelector(X, y)
+    subset = list(range(len(candidate_features) + 1))
+    p_values = selector.p_values(*selector.fit(subset), len(subset))[1:]
+    np.testing.assert_allclose(p_values, ols_p_values(X, y, candidate_features).to_numpy(), rtol=1e-6, atol=1e-12)
+
+def test_keeps_best_column_when_none_is_significant():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(200, 3)), columns=['a', 'b', 'c'])
+    y = pd.Series(rng.normal(500000, 1000, 200))
+    selected = feature_selection(X, y)
+    # The first column forward selection would add
+    best = min(X.columns, key=lambda col: ols_p_values(X, y, [col])[col])
+    assert list(selected.columns) == [best]
+
+def test_fewer_rows_than_columns_uses_forward_selection():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(5, 6)), columns=list('abcdef'))
+    y = X['a'] * 3 + rng.normal(size=5) * 0.01
+    assert stepwise_selection(X, y) == ['a']
+    with pytest.raises(ValueError):
+        selector = StepwiseSelector(X, y)
+        selector.p_values(*selector.fit(list(range(7))), 7)
+
+# Online updates against a full refit of the scaler and the regression
+def test_online_model_matches_full_refit(engineered):
+    online = OnlineLinearModel()
+    for batch in np.array_split(np.arange(len(engineered)), [500, 501, 1200]):
+        online.partial_fit(engineered.iloc[batch])
+    assert online.n == len(engineered)
+    assert online.matches_refit(engineered)
+    assert not online.matches_refit(engineered.iloc[:500])
+
+def test_update_model_requires_saved_statistics(engineered, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(FileNotFoundError):
+        update_model(engineered.head(3))
+
+def test_update_model_extends_the_trained_model(engineered, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = engineered[predominant_features + ['price']]
+    main(df)
+
+    # The saved statistics reproduce the model trained by main
+    online = OnlineLinearModel.load()
+    X = df[online.features]
+    np.testing.assert_allclose(online.model.predict(online.scaler.transform(X)),
+                               load('trained_model.joblib').predict(load('trained_scaler.joblib').transform(X)), rtol=1e-6)
+
+    # New sold listings (a full engineered frame) are folded into the training rows of main
+    batch = engineered.tail(3)
+    online = update_model(batch)
+    train_rows = train_test_split(df, test_size=0.2, random_state=42)[0]
+    assert online.n == len(train_rows) + 3
+    assert online.matches_refit(pd.concat([train_rows, batch]))
+    assert load('trained_scaler.joblib').n_samples_seen_ == online.n
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+import pytest
+from modules.data_preprocessing import FeaturePipeline
+from modules.modeling import main, predominant_features, ModelRegistry
+from modules.scoring_server import ScoringServer
+
+# Scoring server on an ephemeral localhost port, requests sent concurrently over raw HTTP
+
+@pytest.fixture(scope='module')
+def scoring(cleaned, engineered, tmp_path_factory):
+    artifacts = tmp_path_factory.mktemp('artifacts')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(artifacts)
+        main(engineered[predominant_features + ['price']])
+    registry = ModelRegistry(os.path.join(artifacts, 'trained_model.joblib'), os.path.join(artifacts, 'trained_scaler.joblib'))
+    return FeaturePipeline().fit(cleaned), registry
+
+@pytest.fixture(scope='module')
+def listings(train):
+    return train.head(5).astype(object).where(train.head(5).notna(), None).to_dict(orient='records')
+
+async def request(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+def run_server(scoring, scenario, batch_window=0.2):
+    # Runs scenario(server, port) against a server started for the test, with counted scoring calls
+    feature_pipeline, registry = scoring
+
+    async def main():
+        server = ScoringServer(feature_pipeline, registry, batch_window=batch_window)
+        score_batch = server.batcher.score_batch
+        server.scoring_calls = 0
+
+        def counted(df):
+            server.scoring_calls += 1
+            return score_batch(df)
+
+        server.batcher.score_batch = counted
+        listening = await server.start('127.0.0.1', 0)
+        try:
+            return await scenario(server, listening.sockets[0].getsockname()[1])
+        finally:
+            await server.stop()
+
+    return asyncio.run(main())
+
+def test_concurrent_requests_are_coalesced(scoring, listings):
+    async def scenario(server, port):
+        responses = await asyncio.gather(*[request(port, 'POST', '/predict', listing) for listing in listings])
+        return responses, await request(port, 'GET', '/metrics'), server.scoring_calls
+
+    responses, (status, metrics), scoring_calls = run_server(scoring, scenario)
+    assert [status for status, _ in responses] == [200] * 5
+    assert all(len(payload['predictions']) == 1 and payload['predictions'][0]['Predicted_Price'] > 0 for _, payload in responses)
+    assert {payload['batch_size'] for _, payload in responses} == {5}
+    assert scoring_calls == 1
+
+    assert status == 200
+    assert (metrics['requests'], metrics['listings'], metrics['batches'], metrics['errors'], metrics['rejected']) == (5, 5, 1, 0, 0)
+    assert metrics['batch_sizes'] == {'5': 1}
+    assert metrics['latency_ms']['p50'] is not None
+
+def test_bad_request_does_not_fail_its_batch_mates(scoring, listings):
+    async def scenario(server, port):
+        bad = request(port, 'POST', '/predict', {**listings[0], 'Prix': 'abc $'})
+        responses = await asyncio.gather(bad, *[request(port, 'POST', '/predict', listing) for listing in listings[1:]])
+        return responses, await request(port, 'GET', '/metrics'), server.scoring_calls
+
+    responses, (_, metrics), scoring_calls = run_server(scoring, scenario)
+    (bad_status, bad_payload), good = responses[0], responses[1:]
+    assert bad_status == 400 and 'Prix' in bad_payload['error']
+
+    # The bad listing never joined the batch: one scoring call, no per-request fallback
+    assert [status for status, _ in good] == [200] * 4
+    assert {payload['batch_size'] for _, payload in good} == {4}
+    assert scoring_calls == 1
+    assert (metrics['requests'], metrics['listings'], metrics['batches'], metrics['errors'], metrics['rejected']) == (4, 4, 1, 0, 1)
+
+def test_malformed_payloads_are_client_errors(scoring, listings):
+    async def scenario(server, port):
+        return await asyncio.gather(request(port, 'POST', '/predict', [listings[0], 'not a listing']),
+                                    request(port, 'POST', '/predict', {**listings[0], 'Un. rés.': None}),
+                                    request(port, 'GET', '/unknown'))
+
+    statuses = [status for status, _ in run_server(scoring, scenario)]
+    assert statuses == [400, 400, 404]
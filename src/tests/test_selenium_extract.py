@@ -0,0 +1,212 @@
+import glob
+import json
+import os
+import threading
+import time
+import pytest
+from lxml import html
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+from conftest import input_dir
+import selenium_extract
+from parse_pages import find_all, element_text, parse_house
+
+# The scraper against the static replica of input/replica, through a stub driver that renders the pages with lxml
+
+replica_dir = os.path.join(input_dir, 'replica')
+search_url = 'file://' + os.path.join(replica_dir, 'search.html')
+
+class ReplicaDriver:
+    def __init__(self):
+        self.generation = 0
+
+    def load(self, path):
+        # Missing pages render like a browser error page
+        self.generation += 1
+        self.path = path
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.page_source = f.read()
+        else:
+            self.page_source = '<html><body><h1>File not found</h1></body></html>'
+        self.tree = html.fromstring(self.page_source)
+
+    def get(self, url):
+        self.load(url.replace('file://', '', 1))
+
+    def find_elements(self, by, value):
+        return find_elements(self, self.tree, by, value)
+
+    def find_element(self, by, value):
+        return find_element(self, self.tree, by, value)
+
+    def execute_script(self, script, link, index):
+        # open_house: the Redisplay link of search.html opens house_<index + 1>.html, like its onclick handler
+        self.load(os.path.join(os.path.dirname(self.path), f'house_{index + 1}.html'))
+
+    def quit(self):
+        pass
+
+class ReplicaElement:
+    def __init__(self, driver, node):
+        self.driver = driver
+        self.node = node
+        self.generation = driver.generation
+
+    def check(self):
+        if self.driver.generation != self.generation:
+            raise StaleElementReferenceException('page changed')
+
+    @property
+    def text(self):
+        self.check()
+        return element_text(self.node)
+
+    def find_elements(self, by, value):
+        self.check()
+        return find_elements(self.driver, self.node, by, value)
+
+    def find_element(self, by, value):
+        self.check()
+        return find_element(self.driver, self.node, by, value)
+
+    def click(self):
+        self.check()
+        self.driver.load(os.path.join(os.path.dirname(self.driver.path), self.node.get('href')))
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+def find_elements(driver, node, by, value):
+    nodes = find_all(node, value) if by == By.CSS_SELECTOR else node.xpath(value)
+    return [ReplicaElement(driver, found) for found in nodes]
+
+def find_element(driver, node, by, value):
+    found = find_elements(driver, node, by, value)
+    if not found:
+        raise NoSuchElementException(value)
+    return found[0]
+
+@pytest.fixture
+def drivers(tmp_path, monkeypatch):
+    # Checkpoints in a temporary directory, every driver created is recorded
+    monkeypatch.chdir(tmp_path)
+    created = []
+
+    def make_driver(browser='firefox'):
+        created.append(ReplicaDriver())
+        return created[-1]
+
+    monkeypatch.setattr(selenium_extract, 'make_driver', make_driver)
+    return created
+
+def replica_houses():
+    pages = sorted(glob.glob(os.path.join(replica_dir, 'house_*.html')))
+    houses = []
+    for page in pages:
+        with open(page, encoding='utf-8') as f:
+            houses.append(parse_house(f.read()))
+    return houses
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def test_scrape_url_on_replica(drivers):
+    assert selenium_extract.scrape_url(0, search_url) == 3
+    assert read_json('all_houses_1.json') == replica_houses()
+    assert len(drivers) == 1
+
+def test_completed_url_is_skipped_without_driver(drivers):
+    selenium_extract.scrape_url(0, search_url)
+    assert selenium_extract.scrape_url(0, search_url) == 3
+    assert selenium_extract.scrape_url_with_retry(0, search_url, retries=0) == 3
+    assert len(drivers) == 1
+    assert read_json('all_houses_1.json') == replica_houses()
+
+def test_completed_legacy_checkpoint(drivers):
+    # A complete all_houses_N.json from the original scraper: no total recorded, the last house is opened
+    with open('all_houses_1.json', 'w') as f:
+        json.dump(replica_houses(), f)
+
+    start = time.perf_counter()
+    assert selenium_extract.scrape_url(0, search_url) == 3
+    assert time.perf_counter() - start < 5  # no wait timing out
+    assert read_json('all_houses_1.json') == replica_houses()
+
+    # The total is now recorded
+    assert selenium_extract.scrape_url(0, search_url) == 3
+    assert len(drivers) == 1
+
+@pytest.mark.parametrize('legacy', [False, True])
+def test_resume_partial_checkpoint(drivers, legacy):
+    if legacy:
+        with open('all_houses_1.json', 'w') as f:
+            json.dump(replica_houses()[:1], f)
+    else:
+        selenium_extract.scrape_url(0, search_url)
+        with open('all_houses_1.jsonl') as f:
+            first = f.readline()
+        with open('all_houses_1.jsonl', 'w') as f:
+            f.write(first)
+
+    assert selenium_extract.scrape_url(0, search_url) == 3
+    assert read_json('all_houses_1.json') == replica_houses()
+
+# Listings shared by several searches are scraped once
+def test_add_if_new_is_atomic(tmp_path):
+    seen = selenium_extract.SeenCentris(str(tmp_path / 'seen.txt'))
+    ids = [str(20000000 + n) for n in range(200)]
+    claimed = []
+    barrier = threading.Barrier(4)
+
+    def claim():
+        barrier.wait()
+        claimed.extend(no_centris for no_centris in ids if seen.add_if_new(no_centris))
+
+    threads = [threading.Thread(target=claim) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seen.close()
+
+    assert sorted(claimed) == ids
+    with open(tmp_path / 'seen.txt') as f:
+        assert sorted(f.read().split()) == ids
+
+def scraped(n_urls):
+    return [house for i in range(n_urls) for house in read_json(f'all_houses_{i+1}.json')]
+
+def test_scrape_all_scrapes_shared_listings_once(drivers):
+    assert selenium_extract.scrape_all([search_url, search_url], workers=2, backoff=0) == [3, 3]
+    assert sorted(scraped(2), key=lambda house: house['No Centris']) == replica_houses()
+    assert len(drivers) == 2
+
+def test_legacy_checkpoint_seeds_seen_listings(drivers):
+    with open('all_houses_1.json', 'w') as f:
+        json.dump(replica_houses(), f)
+
+    assert selenium_extract.scrape_all([search_url, search_url], workers=1, backoff=0) == [3, 3]
+    assert read_json('all_houses_1.json') == replica_houses()
+    assert read_json('all_houses_2.json') == []
+    with open('all_houses_2.jsonl') as f:
+        assert [json.loads(line)['_duplicate'] for line in f] == [house['No Centris'] for house in replica_houses()]
+
+def test_failed_listing_is_released_for_the_retry(drivers, monkeypatch):
+    scrape_house = selenium_extract.scrape_house
+    failures = []
+
+    def flaky_scrape_house(driver):
+        if not failures:
+            failures.append(driver)
+            raise StaleElementReferenceException('page changed')
+        return scrape_house(driver)
+
+    monkeypatch.setattr(selenium_extract, 'scrape_house', flaky_scrape_house)
+    assert selenium_extract.scrape_all([search_url], workers=1, backoff=0) == [3]
+    assert read_json('all_houses_1.json') == replica_houses()
+    assert len(drivers) == 2